@@ -1,13 +1,38 @@
 import random
+from array import array
+
+SUITS = ("Clubs", "Diamonds", "Hearts", "Spades")
+RANKS = ("Jack", "Queen", "King", "Ace", "2", "3", "4", "5", "6", "7", "8", "9", "10")
+
+# The dealer draws until reaching this value, soft 17 included
+DEALER_STANDS_ON = 17
+
+# Card codes are small ints: rank index * 4 + suit index (0..51)
+_RANK_INDEX = {rank: i for i, rank in enumerate(RANKS)}
+_SUIT_INDEX = {suit: i for i, suit in enumerate(SUITS)}
+
+# Points of each rank with the ace counted as 1, a hand adds 10 for one ace when it fits
+RANK_POINTS = {"Jack": 10, "Queen": 10, "King": 10, "Ace": 1, "2": 2, "3": 3, "4": 4,
+               "5": 5, "6": 6, "7": 7, "8": 8, "9": 9, "10": 10}
+
+def encode_card(rank, suit):
+    return _RANK_INDEX[rank] * 4 + _SUIT_INDEX[suit]
+
+def decode_card(code):
+    return RANKS[code >> 2], SUITS[code & 3]
+
 
 class Deck:
     def __init__(self):
+        # an optional card counter, it sees every drawn card (see counting.py)
+        self.tracker = None
         self.restart()
 
-#taking 1 card from the deck
+#taking 1 card from the deck, the deck is already shuffled so the last card is random
     def draw(self):
-        card = random.choice(self.cards)
-        self.cards.remove(card)
+        card = self.cards.pop()
+        if self.tracker is not None:
+            self.tracker.see(card.code)
         return card
 
 #It seems I can look at cards in my deck
@@ -19,15 +44,107 @@ class Deck:
         suits = ["Clubs", "Diamonds", "Hearts", "Spades"]
         ranks = ["Jack", "Queen", "King", "Ace", "2", "3", "4", "5", "6", "7", "8", "9", "10"]
         self.cards = [Card(rank, suit) for rank in ranks for suit in suits]
+        random.shuffle(self.cards)
+        if self.tracker is not None:
+            self.tracker.reset()
 
 
+# Same interface as Deck but the cards are kept as one byte each,
+# Card objects are only created when a card leaves the deck
+class CompactDeck:
+    __slots__ = ("cards",)
+
+    def __init__(self, codes=None):
+        if codes is None:
+            self.restart()
+        else:
+            self.cards = array('B', codes)
+
+    def draw(self):
+        return Card.from_code(self.cards.pop())
+
+    def draw_code(self):
+        return self.cards.pop()
+
+    def look_deck(self):
+        return len(self.cards)
+
+    def restart(self):
+        codes = list(range(52))
+        random.shuffle(codes)
+        self.cards = array('B', codes)
+
+    def to_list(self):
+        return self.cards.tolist()
+
+
+
+# Several decks shuffled together. The card order never changes between
+# shuffles, so only the position has to move while the shoe is dealt.
+class Shoe:
+    __slots__ = ("num_decks", "penetration", "cards", "position", "cut_card", "tracker", "shuffled")
+
+    def __init__(self, num_decks=6, penetration=0.75, cards=None, position=0):
+        if num_decks < 1:
+            raise ValueError("A shoe needs at least one deck")
+        if not 0 < penetration <= 1:
+            raise ValueError("Penetration must be between 0 and 1")
+        self.num_decks = num_decks
+        self.penetration = penetration
+        self.tracker = None
+        if cards is None:
+            self.shuffle()
+        else:
+            self.cards = bytes(cards)
+            self.position = position
+            self.cut_card = int(len(self.cards) * penetration)
+            self.shuffled = False
+
+#taking the next card, a shoe that runs out mid hand is reshuffled
+    def draw(self):
+        if self.position >= len(self.cards):
+            self.shuffle()
+        code = self.cards[self.position]
+        self.position += 1
+        if self.tracker is not None:
+            self.tracker.see(code)
+        return Card.from_code(code)
+
+    def look_deck(self):
+        return len(self.cards) - self.position
+
+#the cut card was reached, shuffle before the next round
+    def needs_shuffle(self):
+        return self.position >= self.cut_card
+
+    def shuffle(self):
+        codes = list(range(52)) * self.num_decks
+        random.shuffle(codes)
+        self.cards = bytes(codes)
+        self.position = 0
+        self.cut_card = int(len(self.cards) * self.penetration)
+        # a new order the owner has not stored yet
+        self.shuffled = True
+        if self.tracker is not None:
+            self.tracker.reset()
+
 
 class Card:
+    __slots__ = ("rank", "suit", "visible")
+
     def __init__(self, rank, suit, visible=True):
         self.rank = rank
         self.suit = suit
         self.visible = visible
 
+    @classmethod
+    def from_code(cls, code, visible=True):
+        return cls(RANKS[code >> 2], SUITS[code & 3], visible)
+
+    @property
+    def code(self):
+        return encode_card(self.rank, self.suit)
+
 #how does card looks like
     def show(self):
         if not self.visible:
@@ -40,9 +157,15 @@ class Card:
 
 
 class Hand:
+    # The hard total (aces as 1) and the ace count are kept up to date
+    # as cards come and go, so the value never needs a rescan
+    __slots__ = ("hand", "stored_cards", "_hard", "_aces")
+
     def __init__(self):
         self.hand = []
         self.stored_cards = []
+        self._hard = 0
+        self._aces = 0
 
     def __len__(self):
         return len(self.hand)
@@ -50,9 +173,14 @@ class Hand:
 #adding card to my hand
     def add_card(self, card):
         self.hand.append(card)
+        self._hard += RANK_POINTS[card.rank]
+        if card.rank == "Ace":
+            self._aces += 1
 
     def restart_hand(self):
         self.hand = []
+        self._hard = 0
+        self._aces = 0
 
     def remove_card(self):
         if not self.hand:
@@ -61,6 +189,9 @@ class Hand:
 
         removed_card = self.hand.pop(0)
         self.stored_cards.append(removed_card)
+        self._hard -= RANK_POINTS[removed_card.rank]
+        if removed_card.rank == "Ace":
+            self._aces -= 1
 
         print (f"Success removing {removed_card.show()} from hand.")
 
@@ -72,21 +203,20 @@ class Hand:
             if not card.visible:
                 card.flip()
 
+#one ace can count as 11 as long as the hand stays at 21 or below
     def get_value(self):
-        value = 0
-        aces = 0
-        for card in self.hand:
-            if card.rank in ['Jack', 'Queen', 'King']:
-                value += 10
-            elif card.rank == 'Ace':
-                aces += 1
-                value += 11
-            else:
-                value += int(card.rank)
-        while value > 21 and aces:
-            value -= 10
-            aces -= 1
-        return value
+        if self._aces and self._hard <= 11:
+            return self._hard + 10
+        return self._hard
+
+    def is_soft(self):
+        return self._aces > 0 and self._hard <= 11
+
+    def is_blackjack(self):
+        return len(self.hand) == 2 and self.get_value() == 21
+
+    def is_bust(self):
+        return self._hard > 21
 
 #It seems I can look at cards in my hand
     def look(self):
@@ -140,15 +270,11 @@ class Player:
         self.balance += self.current_bet
         print("It's a push! Bet returned to player.")
 
-    #way to double bet
-    def double_bet(self, deck):
-        if self.balance >= self.current_bet:
-            self.current_bet *= 2
-            self.receive_card(deck)
-            return True
-        elif self.balance <= self.current_bet:
+    #way to double bet, the second bet is paid like the first one and one more card comes
+    def double_bet(self, card):
+        if self.balance < self.current_bet:
             return False
-
-
-
-
+        self.balance -= self.current_bet
+        self.current_bet *= 2
+        self.receive_card(card)
+        return True
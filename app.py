@@ -1,10 +1,26 @@
+import json
 import os
+import uuid
+from datetime import datetime
+import hashlib
 from functools import wraps
-from flask import Flask, render_template, request, redirect, url_for, session
-from BJ_classes import Deck, Hand, Card
-from database import db, User
-from werkzeug.security import generate_password_hash,check_password_hash
+from flask import (Flask, render_template, request, redirect, url_for, session, jsonify, Response,
+                   make_response, stream_with_context)
+from BJ_classes import Shoe, RANK_POINTS, encode_card, decode_card
+from database import (db, User, take_bet, record_move, refund_bet, settle_round, utcnow, configure_database,
+                      check_database, read_user)
+from shoe_store import make_shoe_store
+import strategy
+import rules
+import leaderboard
+from counting import CountTracker
+from instrumentation import init_instrumentation
+from tables import TableManager
+from security import PasswordHasher, HasherBusy, TokenBucket
+from session_codec import CompactSessionInterface
+from assets import init_assets
 from dotenv import load_dotenv
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 load_dotenv()
 
@@ -12,24 +28,153 @@ app = Flask(__name__)
 app.secret_key= os.environ.get('SECRET_KEY')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
+# Shoe settings, 'memory' only works with a single worker process
+app.config['SHOE_DECKS'] = int(os.environ.get('SHOE_DECKS', 6))
+app.config['SHOE_PENETRATION'] = float(os.environ.get('SHOE_PENETRATION', 0.75))
+app.config['SHOE_STORE'] = os.environ.get('SHOE_STORE', 'memory')
+app.config['REDIS_URL'] = os.environ.get('REDIS_URL')
+# Shared tables: time for a turn before the seat stands, idle time before a table is
+# dropped and how many open tables one player may create
+app.config['TABLE_TURN_SECONDS'] = float(os.environ.get('TABLE_TURN_SECONDS', 30))
+app.config['TABLE_IDLE_SECONDS'] = float(os.environ.get('TABLE_IDLE_SECONDS', 1800))
+app.config['TABLES_PER_USER'] = int(os.environ.get('TABLES_PER_USER', 2))
+# Hints use the full shoe table ('basic') or the cards still in the shoe ('shoe')
+app.config['HINT_MODE'] = os.environ.get('HINT_MODE', 'basic')
+app.config['STRATEGY_TABLE_PATH'] = os.environ.get('STRATEGY_TABLE_PATH')
+# Table rules of the single player game, see rules.Rules
+app.config['RULES'] = rules.Rules(
+    dealer_hits_soft_17=os.environ.get('DEALER_HITS_SOFT_17') == '1',
+    double_after_split=os.environ.get('DOUBLE_AFTER_SPLIT', '1') == '1',
+    resplit_aces=os.environ.get('RESPLIT_ACES') == '1',
+    max_hands=int(os.environ.get('MAX_HANDS', 4)),
+    surrender=os.environ.get('SURRENDER', '1') == '1',
+    insurance=os.environ.get('INSURANCE', '1') == '1',
+    blackjack_pays=float(os.environ.get('BLACKJACK_PAYS', 1.5)))
+# Tag system of the count recorded with every bet (see counting.SYSTEMS)
+app.config['COUNT_SYSTEM'] = os.environ.get('COUNT_SYSTEM', 'hi-lo')
+# Per route timings on /metrics, a sample of requests is also profiled
+app.config['INSTRUMENTATION'] = os.environ.get('INSTRUMENTATION') == '1'
+app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', 'profiles')
+# Password hashing, hashes made with other parameters are redone at the next login
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+app.config['PASSWORD_SALT_LENGTH'] = int(os.environ.get('PASSWORD_SALT_LENGTH', 16))
+app.config['HASH_WORKERS'] = int(os.environ.get('HASH_WORKERS', 4))
+app.config['HASH_QUEUE'] = int(os.environ.get('HASH_QUEUE', 32))
+# Login attempts allowed at once and per minute, per username and per IP
+app.config['LOGIN_USER_BURST'] = int(os.environ.get('LOGIN_USER_BURST', 5))
+app.config['LOGIN_USER_PER_MINUTE'] = float(os.environ.get('LOGIN_USER_PER_MINUTE', 5))
+app.config['LOGIN_IP_BURST'] = int(os.environ.get('LOGIN_IP_BURST', 20))
+app.config['LOGIN_IP_PER_MINUTE'] = float(os.environ.get('LOGIN_IP_PER_MINUTE', 30))
+# Behind a reverse proxy every request comes from the proxy, set the number of proxies
+# in front of the app so the IP limit counts the client from X-Forwarded-For instead
+app.config['PROXY_FIX_HOPS'] = int(os.environ.get('PROXY_FIX_HOPS', 0))
+if app.config['PROXY_FIX_HOPS']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_HOPS'],
+                            x_proto=app.config['PROXY_FIX_HOPS'])
+# Session cookies use the binary codec, zlib is only applied when it makes them smaller
+app.config['SESSION_COMPRESSION'] = os.environ.get('SESSION_COMPRESSION', '1') == '1'
+app.session_interface = CompactSessionInterface(app.config['SESSION_COMPRESSION'])
+# Compiled templates are cached here, Jinja picks a temporary directory when unset
+app.config['TEMPLATE_CACHE_DIR'] = os.environ.get('TEMPLATE_CACHE_DIR')
+
+configure_database(app)
 db.init_app(app)
+check_database(app)
+init_assets(app)
+init_instrumentation(app)
 # Helper functions
-def object_to_dict(hand_object):
-    card_list = []
-    for card in hand_object.hand:
-        card_list.append({'rank': card.rank, 'suit': card.suit})
-    return card_list
-
-def dict_to_hand(card_list):
-    hand = Hand() 
-    if card_list is None:
-        return hand
+def get_shoe_store():
+    if 'shoe_store' not in app.extensions:
+        app.extensions['shoe_store'] = make_shoe_store(app)
+    return app.extensions['shoe_store']
+
+def load_shoe():
+    # The session only knows which shoe is ours and how far it was dealt
+    store = get_shoe_store()
+    shoe_id = session.get('shoe_id')
+    shoe = store.load(shoe_id) if shoe_id else None
+    if shoe is None:
+        shoe_id = uuid.uuid4().hex
+        shoe = Shoe(app.config['SHOE_DECKS'], app.config['SHOE_PENETRATION'])
+        store.save(shoe_id, shoe)
+        shoe.shuffled = False
+        session['shoe_id'] = shoe_id
+        session['shoe_pos'] = 0
+        # the count of a lost shoe means nothing for the new one
+        session.pop('running_count', None)
+    shoe.position = session.get('shoe_pos', 0)
+    # The running count travels with the position, the tracker keeps it up to date
+    tracker = CountTracker(app.config['COUNT_SYSTEM'], shoe.num_decks)
+    running = session.get('running_count')
+    if running is None:
+        # a session from before counting, counted once from the dealt cards
+        tracker.see_all(shoe.cards[:shoe.position])
     else:
-        for card_data in card_list:
-            recreated_card = Card(card_data['rank'], card_data['suit'])
-            hand.add_card(recreated_card)
-        return hand
+        tracker.running, tracker.seen = running, shoe.position
+    shoe.tracker = tracker
+    return shoe
+
+def save_shoe(shoe):
+    # A shuffled shoe has a new order, it is stored once
+    if shoe.shuffled:
+        get_shoe_store().save(session['shoe_id'], shoe)
+        shoe.shuffled = False
+    session['shoe_pos'] = shoe.position
+    session['running_count'] = shoe.tracker.running
+
+def finish_round(outcome, payout):
+    # Pays out and writes the ledger row, a round key is only settled once
+    # and a round without one is never settled
+    round_key = session.pop('round_key', None)
+    session.pop('round_step', None)
+    started = session.pop('round_started', None)
+    if round_key is None:
+        return False
+    started_at = datetime.fromisoformat(started) if started else utcnow()
+    settled = settle_round(session['user_id'], round_key, session.get('bet', 0),
+                           outcome, payout, started_at, session.pop('true_count', None))
+    leaderboard.invalidate(session.get('username'))
+    return settled
+
+def get_tables():
+    if 'tables' not in app.extensions:
+        app.extensions['tables'] = TableManager(app.config['SHOE_DECKS'],
+                                                app.config['SHOE_PENETRATION'],
+                                                app.config['TABLE_TURN_SECONDS'],
+                                                app.config['TABLE_IDLE_SECONDS'],
+                                                app.config['TABLES_PER_USER'])
+    return app.extensions['tables']
+
+def settle_table_rounds(settlements):
+    for user_id, round_key, bet, outcome, payout in settlements:
+        settle_round(user_id, round_key, bet, outcome, payout, utcnow())
+    if settlements:
+        leaderboard.invalidate()
+
+def get_hasher():
+    if 'password_hasher' not in app.extensions:
+        app.extensions['password_hasher'] = PasswordHasher(app.config['PASSWORD_HASH_METHOD'],
+                                                           app.config['PASSWORD_SALT_LENGTH'],
+                                                           app.config['HASH_WORKERS'],
+                                                           app.config['HASH_QUEUE'])
+    return app.extensions['password_hasher']
+
+def login_allowed(username):
+    # Checked before any hashing so a flood costs almost nothing
+    if 'login_limits' not in app.extensions:
+        app.extensions['login_limits'] = (
+            TokenBucket(app.config['LOGIN_USER_BURST'], app.config['LOGIN_USER_PER_MINUTE'] / 60),
+            TokenBucket(app.config['LOGIN_IP_BURST'], app.config['LOGIN_IP_PER_MINUTE'] / 60))
+    per_user, per_ip = app.extensions['login_limits']
+    ip_ok = per_ip.allow(request.remote_addr)
+    return ip_ok and (username is None or per_user.allow(username))
+
+def get_strategy_table():
+    if 'strategy_table' not in app.extensions:
+        app.extensions['strategy_table'] = strategy.get_table(app.config['SHOE_DECKS'],
+                                                              app.config['STRATEGY_TABLE_PATH'])
+    return app.extensions['strategy_table']
 
 # Decorator for login
 def login_required(f):
@@ -42,18 +187,32 @@ def login_required(f):
     return decorated_function
 
 
+def api_login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            return jsonify(error="Login required"), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
+
 @app.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         username = request.form.get('username')
         password = request.form.get('password')
+        if not login_allowed(None):
+            return "Too many attempts, try again later", 429
 
         # Check if nickname is takem
         if User.query.filter_by(username=username).first():
             return "Nickname take! Try another one."
 
         # Hash and save password
-        hashed_pw = generate_password_hash(password)
+        try:
+            hashed_pw = get_hasher().hash(password)
+        except HasherBusy:
+            return "Server busy, try again", 503
         new_user = User(username=username, password_hash=hashed_pw, money=1000)
         try:
             db.session.add(new_user)
@@ -72,9 +231,20 @@ def login():
         username = request.form.get('username')
         password = request.form.get('password')
 
-        user = User.query.filter_by(username=username).first()
+        if not login_allowed(username):
+            return "Too many login attempts, try again later", 429
 
-        if user and check_password_hash(user.password_hash, password):
+        user = User.query.filter_by(username=username).first()
+        hasher = get_hasher()
+        try:
+            valid = user is not None and hasher.verify(user.password_hash, password)
+            if valid and hasher.needs_rehash(user.password_hash):
+                user.password_hash = hasher.hash(password)
+                db.session.commit()
+        except HasherBusy:
+            return "Server busy, try again", 503
+
+        if valid:
             session['user_id'] = user.id
             session['username'] = user.username
             return redirect(url_for('home'))
@@ -88,113 +258,416 @@ def login():
 @login_required
 def home():
     #fetch the current userdata
-    current_user = db.session.get(User, session['user_id'])
+    current_user = read_user(session['user_id'])
     return render_template('home.html', user=current_user)
 
 
-@app.route("/hit")
+# Game actions, shared by the HTML routes and the JSON api.
+# The round is a rules.State packed into the session, the shoe is stored apart.
+NOT_ALLOWED = "That move is not possible now"
+
+RESULT_TEXT = {
+    'blackjack': "Blackjack! Player wins",
+    'win': "Player wins",
+    'push': "It's a tie",
+    'loss': "Dealer win",
+    'bust': "Bust! YOU GAINED MORE THAN 21",
+    'surrender': "Surrendered, half the bet is returned",
+}
+
+def card_dicts(codes):
+    return [{'rank': rank, 'suit': suit} for rank, suit in map(decode_card, codes)]
+
+def load_round(shoe=None):
+    # The round in play or the last one played, None before the first deal.
+    # Without the shoe the round can be shown but not played.
+    cards, pos = (shoe.cards, shoe.position) if shoe is not None else (None, 0)
+    data = session.get('play')
+    if data is not None:
+        return rules.unpack(data, cards, pos)
+    if session.get('player_hand') is None or session.get('game_over'):
+        return None
+    # a hand dealt before the rules engine, it is played on with one hand
+    player = tuple(encode_card(c['rank'], c['suit']) for c in session['player_hand'])
+    dealer = tuple(encode_card(c['rank'], c['suit']) for c in session.get('dealer_hand') or [])
+    hand = rules.PlayerHand(player, session.get('bet', 0))
+    return rules.State(cards, pos, rules.PLAYER, (hand,), 0, dealer, 0, ())
+
+def advance(shoe, move):
+    # move(cards, pos) plays on from the shoe. A shoe that runs out mid round is
+    # shuffled and the move played again from the top, as Shoe.draw does
+    try:
+        return move(shoe.cards, shoe.position)
+    except rules.ShoeExhausted:
+        shoe.shuffle()
+        return move(shoe.cards, 0)
+
+def store_round(shoe, state):
+    # The shoe moves on to where the round left it, a finished round is settled
+    shoe.tracker.see_all(shoe.cards[shoe.position:state.pos])
+    shoe.position = state.pos
+    save_shoe(shoe)
+    for key in ('player_hand', 'dealer_hand', 'result', 'game_over', 'deck'):
+        session.pop(key, None)
+    session['play'] = rules.pack(state)
+    session['bet'] = rules.wagered(state)
+    if state.phase == rules.DONE:
+        paid = rules.payout(state)
+        if paid > session['bet']:
+            finish_round('win', paid)
+        elif paid == session['bet']:
+            finish_round('push', paid)
+        else:
+            finish_round('loss', paid)
+
+def result_text(state):
+    if state.phase != rules.DONE:
+        return None
+    dealer_busts = rules.hand_value(state.dealer)[0] > 21
+    texts = ["Dealer busts, Player win!" if label == 'win' and dealer_busts else RESULT_TEXT[label]
+             for label, _ in state.results]
+    if len(texts) == 1:
+        text = texts[0]
+    else:
+        text = ", ".join(f"Hand {number}: {text}" for number, text in enumerate(texts, 1))
+    if state.insurance and rules.is_blackjack(state.dealer):
+        text += ", insurance pays 2:1"
+    return text
+
+def play_deal(bet_amount):
+    if bet_amount < 1:
+        return "Invalid bet"
+    # Can the user afford bet? Checked and paid in one statement, a refused
+    # bet leaves the round in play as it is
+    if not take_bet(session['user_id'], bet_amount):
+        return "You don't have enough money"
+    # Leaving a hand unfinished forfeits its bets, a settled round has no key left
+    if session.get('round_key'):
+        finish_round('loss', 0)
+    session['bet'] = bet_amount
+    session['round_key'] = uuid.uuid4().hex
+    session['round_step'] = 0
+    session['round_started'] = utcnow().isoformat()
+    # shuffle once the cut card came out
+    shoe = load_shoe()
+    if shoe.needs_shuffle():
+        shoe.shuffle()
+    # the count the bet was made against
+    session['true_count'] = round(shoe.tracker.true_count(), 2)
+    store_round(shoe, advance(shoe, lambda cards, pos: rules.deal(app.config['RULES'], cards,
+                                                                  pos, bet_amount)))
+    return None
+
+def play_action(action):
+    # Hit, stand, double, split, surrender or (no_)insurance. Extra bets are
+    # paid with the move, an error message comes back when it cannot be made
+    shoe = load_shoe()
+    state = load_round(shoe)
+    table_rules = app.config['RULES']
+    if state is None or action not in rules.legal_actions(table_rules, state):
+        return NOT_ALLOWED
+    # a move is recorded against the round with its step, so the same
+    # session sent twice cannot pay for or make the move again. A round
+    # without a key (dealt before the ledger) cannot be settled and is not played
+    round_key = session.get('round_key')
+    if round_key is None:
+        return NOT_ALLOWED
+    step = session.get('round_step', 0)
+    refused = record_move(session['user_id'], round_key, step, action, rules.cost(state, action))
+    if refused == 'money':
+        return "You don't have enough money"
+    if refused:
+        return NOT_ALLOWED
+    session['round_step'] = step + 1
+    store_round(shoe, advance(shoe, lambda cards, pos: rules.apply(
+        table_rules, state._replace(cards=cards, pos=pos), action)))
+    return None
+
+def game_state(user=None):
+    # What the player is allowed to see, the hole card stays hidden until the end
+    state = load_round()
+    if state is None:
+        return None
+    if user is None:
+        user = db.session.get(User, session['user_id'])
+    game_over = state.phase == rules.DONE
+    playing = state.phase == rules.PLAYER
+    hands = [{
+        'cards': card_dicts(hand.cards),
+        'score': rules.hand_value(hand.cards)[0],
+        'bet': hand.bet,
+        'result': state.results[index][0] if game_over else None,
+    } for index, hand in enumerate(state.hands)]
+    shown = hands[state.active if playing else 0]
+    dealer = card_dicts(state.dealer)
+    return {
+        'player_hand': shown['cards'],
+        'player_score': shown['score'],
+        'hands': hands,
+        'active': state.active if playing else None,
+        'actions': list(rules.legal_actions(app.config['RULES'], state)),
+        'dealer_hand': dealer if game_over else [None] + dealer[1:],
+        'dealer_score': rules.hand_value(state.dealer)[0] if game_over else None,
+        'insurance': state.insurance,
+        'result': result_text(state),
+        'game_over': game_over,
+        'bet': session.get('bet'),
+        'money': user.money,
+    }
+
+
+def html_move(action):
+    # Every move is a POST, following a link or a prefetch never plays a hand
+    if load_round() is None:
+        return redirect(url_for('home'))
+    error = play_action(action)
+    # a click on a finished round just shows it again
+    if error and error != NOT_ALLOWED:
+        return error
+    return redirect(url_for('game_board'))
+
+
+@app.route("/hit", methods=['POST'])
 @login_required
 def hit():
-    # Load and deserialize deck to create object for the webpage
-    deck_data = session.get('deck')
-    if deck_data is None:
-        return redirect(url_for('deal'))
-    deck = Deck()
-    deck.cards = [Card(c['rank'], c['suit']) for c in deck_data]
-
-    # Changing Player's hand
-    player_hand = dict_to_hand(session.get('player_hand'))
+    return html_move('hit')
 
-    # Draw the card from the changed deck
-    player_hand.add_card(deck.draw())
 
-    # Setting the strict logic
-    if player_hand.get_value() > 21:
-        session['result'] = "Bust! YOU GAINED MORE THAN 21"
-        session['game_over'] = True
+@app.route("/deal", methods=['POST'])
+@login_required
+def deal():
+    # Get the bet
+    error = play_deal(int(request.form.get('bet_amount')))
+    if error:
+        return error
+    return redirect(url_for('game_board'))
 
-    # Memory of the game session
-    session['deck'] = [{'rank': c.rank, 'suit': c.suit} for c in deck.cards]
-    session['player_hand'] = object_to_dict(player_hand)
 
-    return redirect(url_for('game_board'))
+@app.route("/stand", methods=['POST'])
+@login_required
+def stand():
+    return html_move('stand')
 
 
-@app.route("/deal", methods=['POST'])
+@app.route("/<any(double, split, surrender, insurance, no_insurance):action>", methods=['POST'])
 @login_required
-def deal():
-    # Get the user and the bet
-    user = db.session.get(User, session['user_id'])
-    bet_amount = int(request.form.get('bet_amount'))
-    # Can the user afford bet?
-    if user.money < bet_amount:
-        return "You don't have enough money"
-    user.money -= bet_amount
-    db.session.commit()
-    # Save bet session
-    session['bet'] = bet_amount
-    # initialize the game object
-    deck = Deck()
-    player_hand = Hand()
-    dealer_hand = Hand()
+def move(action):
+    return html_move(action)
 
-    # deal 2 cards
-    player_hand.add_card(deck.draw())
-    player_hand.add_card(deck.draw())
 
-    dealer_hand.add_card(deck.draw())
-    dealer_hand.add_card(deck.draw())
+# JSON api, every action answers with the new game state
+@app.route("/api/v1/state")
+@api_login_required
+def api_state():
+    state = game_state()
+    if state is None:
+        return jsonify(error="No hand in play"), 404
+    return jsonify(state)
 
-    session['deck'] = [{'rank': c.rank, 'suit': c.suit} for c in deck.cards]
-    session['player_hand'] = object_to_dict(player_hand)
-    session['dealer_hand'] = object_to_dict(dealer_hand)
-    session['result'] = None
-    session['game_over'] = False
 
-    return redirect(url_for('game_board'))
+@app.route("/api/v1/deal", methods=['POST'])
+@api_login_required
+def api_deal():
+    data = request.get_json(silent=True) or request.form
+    try:
+        bet_amount = int(data.get('bet_amount'))
+    except (TypeError, ValueError):
+        return jsonify(error="Invalid bet"), 400
+    error = play_deal(bet_amount)
+    if error:
+        return jsonify(error=error), 400
+    return jsonify(game_state())
+
+
+def api_move(action):
+    error = play_action(action)
+    if error == NOT_ALLOWED:
+        return jsonify(error="No hand in play" if load_round() is None else error), 409
+    if error:
+        return jsonify(error=error), 400
+    return jsonify(game_state())
 
 
-@app.route("/stand")
+@app.route("/api/v1/hit", methods=['POST'])
+@api_login_required
+def api_hit():
+    return api_move('hit')
+
+
+@app.route("/api/v1/stand", methods=['POST'])
+@api_login_required
+def api_stand():
+    return api_move('stand')
+
+
+@app.route("/api/v1/<any(double, split, surrender, insurance, no_insurance):action>",
+           methods=['POST'])
+@api_login_required
+def api_action(action):
+    return api_move(action)
+
+
+@app.route("/hint")
 @login_required
-def stand():
-    # RESTORE THE STATE
-    deck_data = session.get('deck')
-    if deck_data is None:
-        return redirect(url_for('deal'))
-    player_data = session.get('player_hand')
-    dealer_data = session.get('dealer_hand')
-    
-    deck = Deck()
-    deck.cards = [Card(c['rank'], c['suit']) for c in deck_data]
-    player_hand = dict_to_hand(player_data)
-    dealer_hand = dict_to_hand(dealer_data)
-    user = db.session.get(User, session['user_id'])
-    bet = session.get('bet', 0)
-    # THE DEALER'S TURN
-    while dealer_hand.get_value() < 17:
-        dealer_hand.add_card(deck.draw())
-    # DETERMINE THE WINNER
-    player_score = player_hand.get_value()
-    dealer_score = dealer_hand.get_value()
-    bet = session.get('bet', 0)
-    user = User.query.get(session['user_id'])
-    if dealer_score > 21:
-        session['result'] = "Dealer busts, Player win!"
-        user.money += bet * 2
-    elif dealer_score > player_score:
-        session['result'] = "Dealer win"
-    elif dealer_score < player_score:
-        session['result'] = "Player wins"
-        user.money += bet * 2
+def hint():
+    state = load_round()
+    if state is None or state.phase != rules.PLAYER:
+        return jsonify(error="No hand in play"), 400
+    value, soft = rules.hand_value(state.hands[state.active].cards)
+
+    # The first dealer card is the hidden one
+    hole, up = state.dealer[0], state.dealer[1]
+    upcard = RANK_POINTS[decode_card(up)[0]]
+    if app.config['HINT_MODE'] == 'shoe':
+        # Cards the player has not seen: the rest of the shoe and the hole card
+        shoe = load_shoe()
+        unseen = list(shoe.cards[shoe.position:])
+        unseen.append(hole)
+        table = strategy.build_table(strategy.shoe_composition(unseen))
     else:
-        session['result'] = "It's a tie"
+        table = get_strategy_table()
+
+    advice = strategy.advise(table, value, soft, upcard)
+    # the table only weighs hit against stand, the other moves follow the rules in play
+    move = rules.basic_strategy(app.config['RULES'], state)
+    if move not in ('hit', 'stand'):
+        advice['action'] = move
+    advice.update(player_score=value, dealer_upcard=upcard)
+    return jsonify(advice)
+
+
+@app.route("/leaderboard")
+@login_required
+def leaderboard_page():
+    by = request.args.get('by', 'money')
+    if by not in leaderboard.RANKINGS:
+        by = 'money'
+    board = leaderboard.top_players(by, 20)
+    return render_template('leaderboard.html', board=board, by=by)
+
+
+@app.route("/api/v1/leaderboard")
+@api_login_required
+def leaderboard_api():
+    by = request.args.get('by', 'money')
+    if by not in leaderboard.RANKINGS:
+        return jsonify(error="Unknown ranking"), 400
+    try:
+        limit = int(request.args.get('limit', 10))
+        after = leaderboard.parse_cursor(by, request.args.get('after'))
+    except ValueError:
+        return jsonify(error="Bad limit or cursor"), 400
+    return jsonify(leaderboard.top_players(by, limit, after))
+
+
+@app.route("/api/v1/users/<username>/stats")
+@api_login_required
+def player_stats_api(username):
+    stats = leaderboard.player_stats(username)
+    if stats is None:
+        return jsonify(error="No such player"), 404
+    return jsonify(stats)
+
+
+# Shared tables, every player at a table gets the new state through /events
+@app.route("/tables", methods=['GET', 'POST'])
+@login_required
+def tables_lobby():
+    tables = get_tables()
+    settle_table_rounds(tables.prune())
+    if request.method == 'POST':
+        table = tables.create(session['user_id'])
+        if table is None:
+            return "You already have open tables, play at one of them", 429
+        return redirect(url_for('table_page', table_id=table.id))
+    return render_template('tables.html', tables=tables.list())
 
-    db.session.commit()
-    session['game_over'] = True
-    # SAVE AND SHOW RESULTS
-    session['deck'] = [{'rank':c.rank, 'suit':c.suit} for c in deck.cards]
-    session['dealer_hand'] = object_to_dict(dealer_hand) 
-    return redirect(url_for('game_board'))
+
+@app.route("/tables/<table_id>")
+@login_required
+def table_page(table_id):
+    table = get_tables().get(table_id)
+    if table is None:
+        return redirect(url_for('tables_lobby'))
+    return render_template('table.html', table_id=table.id, username=session.get('username'))
+
+
+@app.route("/tables/<table_id>/<action>", methods=['POST'])
+@api_login_required
+def table_action(table_id, action):
+    table = get_tables().get(table_id)
+    if table is None:
+        return jsonify(error="No such table"), 404
+    settle_table_rounds(table.expire_turn())
+    user_id = session['user_id']
+    if action == 'join':
+        if table.join(user_id, session.get('username')) is None:
+            return jsonify(error="The table is full"), 409
+        error, settlements = None, []
+    elif action == 'leave':
+        error, settlements = table.leave(user_id)
+    elif action == 'bet':
+        data = request.get_json(silent=True) or request.form
+        try:
+            bet_amount = int(data.get('bet_amount'))
+        except (TypeError, ValueError):
+            return jsonify(error="Invalid bet"), 400
+        if bet_amount < 1:
+            return jsonify(error="Invalid bet"), 400
+        # paid before the table lock is taken, a refused bet is paid back
+        if not take_bet(user_id, bet_amount):
+            return jsonify(error="You don't have enough money"), 409
+        error, settlements = table.place_bet(user_id, bet_amount, uuid.uuid4().hex)
+        if error:
+            refund_bet(user_id, bet_amount)
+    elif action in ('deal', 'hit', 'stand'):
+        error, settlements = getattr(table, action)(user_id)
+    else:
+        return jsonify(error="Unknown action"), 404
+    settle_table_rounds(settlements)
+    if error:
+        return jsonify(error=error), 409
+    return jsonify(table.state(user_id))
+
+
+@app.route("/tables/<table_id>/state")
+@api_login_required
+def table_state(table_id):
+    table = get_tables().get(table_id)
+    if table is None:
+        return jsonify(error="No such table"), 404
+    settle_table_rounds(table.expire_turn())
+    return jsonify(table.state(session['user_id']))
+
+
+@app.route("/tables/<table_id>/events")
+@api_login_required
+def table_events(table_id):
+    table = get_tables().get(table_id)
+    if table is None:
+        return jsonify(error="No such table"), 404
+    user_id = session['user_id']
+
+    # Holds a worker thread until the client goes away, the server needs a
+    # thread per open table page on top of the ones for requests. The stream
+    # also wakes when the turn runs out and stands the seat
+    @stream_with_context
+    def stream():
+        version = None
+        while not table.closed:
+            settle_table_rounds(table.expire_turn())
+            left = table.seconds_left()
+            seen = table.wait_for_change(version, timeout=15 if left is None else min(left + 0.1, 15))
+            if seen == version:
+                # keeps proxies from closing an idle stream
+                yield ": ping\n\n"
+                continue
+            state = table.state(user_id)
+            version = state['version']
+            yield f"data: {json.dumps(state)}\n\n"
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @app.route('/logout')
@@ -206,26 +679,25 @@ def logout():
 @app.route("/game")
 @login_required
 def game_board():
-    user = db.session.get(User, session['user_id'])
-    player_data = session.get('player_hand')
-    dealer_data = session.get('dealer_hand')
-    result = session.get('result')
-    game_over = session.get('game_over')
-
-    if player_data is None:
+    user = read_user(session['user_id'])
+    game = game_state(user)
+    if game is None:
         return redirect(url_for('home'))
-    player_hand = dict_to_hand(player_data)
-    dealer_hand = dict_to_hand(dealer_data)
-
-    return render_template('game.html',
-                           username=session.get('username'),
-                           user=user,
-                           player_hand=player_hand.hand,
-                           player_score=player_hand.get_value(),
-                           dealer_hand=dealer_data,
-                           dealer_score=dealer_hand.get_value(),
-                           result=session.get('result'),
-                           game_over=session.get('game_over'))
+
+    # Same state, same page: the browser keeps its copy when nothing changed
+    etag = hashlib.sha1(json.dumps([
+        app.extensions['assets_version'], session.get('username'), game,
+    ]).encode()).hexdigest()
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = make_response(render_template('game.html', username=session.get('username'),
+                                                 game=game))
+    response.set_etag(etag)
+    # per user page, the browser asks again every time
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,7 @@
+from asgiref.wsgi import WsgiToAsgi
+from app import app
+
+# ASGI entry point, run with an ASGI server: uvicorn asgi:asgi_app
+# Idle and keep-alive connections are held by the event loop, a thread
+# from the pool is only used while a request is being handled.
+asgi_app = WsgiToAsgi(app)
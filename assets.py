@@ -0,0 +1,80 @@
+import hashlib
+import os
+from functools import lru_cache
+from flask import request, url_for
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup, escape
+
+# Template and static file caching for the game pages.
+# Compiled templates are kept on disk so a new worker skips the Jinja compile,
+# static files are linked with a fingerprint of their content and may then be
+# cached by the browser for a year, and the card markup is rendered once per card.
+
+ONE_YEAR = 365 * 24 * 3600
+RED_SUITS = ('Hearts', 'Diamonds')
+
+
+def _file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+
+@lru_cache(maxsize=None)
+def card_html(rank, suit):
+    color = 'red' if suit in RED_SUITS else 'black'
+    return Markup(f'<div class="card {color}">{escape(rank)}<br>{escape(suit)}</div>')
+
+
+BACK_HTML = Markup('<div class="card back"></div>')
+
+
+def cards_html(cards, hide_first=False):
+    # cards are {'rank', 'suit'} dicts, None is a card dealt face down
+    return Markup('\n').join(BACK_HTML if c is None or (hide_first and i == 0)
+                             else card_html(c['rank'], c['suit'])
+                             for i, c in enumerate(cards))
+
+
+def init_assets(app):
+    # Must run before anything touches app.jinja_env
+    cache_dir = app.config.get('TEMPLATE_CACHE_DIR')
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    app.jinja_options = {**app.jinja_options, 'bytecode_cache': FileSystemBytecodeCache(cache_dir)}
+
+    hashes = {}
+
+    def fingerprint(filename):
+        # Hashed once per process, a debug server rereads the file on every change
+        path = os.path.join(app.static_folder, filename)
+        key = (filename, os.path.getmtime(path)) if app.debug else filename
+        if key not in hashes:
+            hashes[key] = _file_hash(path)
+        return hashes[key]
+
+    def asset_url(filename):
+        return url_for('static', filename=filename, v=fingerprint(filename))
+
+    app.add_template_global(asset_url)
+    app.add_template_global(cards_html)
+
+    @app.after_request
+    def cache_static(response):
+        # A fingerprinted url never changes content, anything else is revalidated
+        if request.endpoint == 'static' and response.status_code in (200, 304):
+            filename = request.view_args.get('filename')
+            if request.args.get('v') == fingerprint(filename):
+                response.cache_control.no_cache = None
+                response.cache_control.public = True
+                response.cache_control.max_age = ONE_YEAR
+                response.cache_control.immutable = True
+        return response
+
+    # Part of every page ETag, a deploy with new templates or files changes it
+    digest = hashlib.sha256()
+    for folder in (app.static_folder, os.path.join(app.root_path, app.template_folder)):
+        for root, _, files in sorted(os.walk(folder)):
+            for name in sorted(files):
+                digest.update(_file_hash(os.path.join(root, name)).encode())
+    app.extensions['assets_version'] = digest.hexdigest()[:12]
+    return asset_url
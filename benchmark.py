@@ -0,0 +1,316 @@
+import argparse
+import http.cookiejar
+import itertools
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+import timeit
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+# Load test and micro benchmarks for the app.
+#   python benchmark.py app --rounds 200 [--server]
+#   python benchmark.py micro --save bench_baseline.json
+#   python benchmark.py micro --compare bench_baseline.json
+#   python benchmark.py codec
+# The app runs against DATABASE_URL, an in-memory SQLite database by default.
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Recorder:
+    # Latency, cookie size and query count of every request, grouped by route
+    def __init__(self):
+        self.latency = defaultdict(list)
+        self.cookie = defaultdict(list)
+        self.queries = defaultdict(list)
+        self._query_count = 0
+
+    def count_query(self, *args):
+        self._query_count += 1
+
+    def start(self):
+        self._query_count = 0
+        return time.perf_counter()
+
+    def stop(self, route, started, cookie_bytes):
+        self.latency[route].append(time.perf_counter() - started)
+        self.cookie[route].append(cookie_bytes)
+        self.queries[route].append(self._query_count)
+
+    def report(self):
+        rows = {}
+        for route, times in sorted(self.latency.items()):
+            rows[route] = {
+                'requests': len(times),
+                'p50_ms': percentile(times, 50) * 1000,
+                'p95_ms': percentile(times, 95) * 1000,
+                'p99_ms': percentile(times, 99) * 1000,
+                'req_per_sec': len(times) / sum(times),
+                'cookie_bytes': statistics.mean(self.cookie[route]),
+                'queries': statistics.mean(self.queries[route]),
+            }
+        return rows
+
+
+class TestClientDriver:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        cookie = response.headers.get('Set-Cookie', '')
+        return response.status_code, len(cookie.split(';', 1)[0])
+
+
+class ServerDriver:
+    # A real WSGI server on localhost, requests go over the socket
+    def __init__(self, app):
+        from werkzeug.serving import make_server
+
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.base = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+            NoRedirect())
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data else None
+        req = urllib.request.Request(self.base + path, data=body, method=method)
+        try:
+            response = self.opener.open(req)
+        except urllib.error.HTTPError as error:
+            response = error
+        response.read()
+        cookie = response.headers.get('Set-Cookie', '')
+        return response.status, len(cookie.split(';', 1)[0])
+
+    def close(self):
+        self.server.shutdown()
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Every request is timed on its own, redirects are followed by the loop
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def run_app_benchmark(rounds, use_server=False, players=1):
+    from sqlalchemy import event
+    from app import app
+    from database import db
+
+    recorder = Recorder()
+    with app.app_context():
+        db.create_all()
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', recorder.count_query)
+
+    try:
+        for player in range(players):
+            driver = ServerDriver(app) if use_server else TestClientDriver(app)
+
+            def call(route, method, path, data=None):
+                started = recorder.start()
+                status, cookie_bytes = driver.request(method, path, data)
+                recorder.stop(route, started, cookie_bytes)
+                return status
+
+            name = f"bench{player}-{time.time_ns()}"
+            call('register', 'POST', '/register', {'username': name, 'password': 'bench-password'})
+            call('login', 'POST', '/login', {'username': name, 'password': 'bench-password'})
+            for _ in range(rounds):
+                call('deal', 'POST', '/deal', {'bet_amount': '1'})
+                call('game', 'GET', '/game')
+                # hit once, then stand, like a cautious player
+                call('hit', 'POST', '/hit')
+                call('game', 'GET', '/game')
+                call('stand', 'POST', '/stand')
+                call('game', 'GET', '/game')
+            if use_server:
+                driver.close()
+    finally:
+        event.remove(engine, 'before_cursor_execute', recorder.count_query)
+    return recorder.report()
+
+
+def micro_benchmarks():
+    from BJ_classes import Deck, Hand, Card, Shoe
+    import rules
+
+    hand = Hand()
+    for rank, suit in (('Ace', 'Spades'), ('7', 'Hearts'), ('King', 'Clubs')):
+        hand.add_card(Card(rank, suit))
+    # the round as every game request packs and unpacks it
+    shoe = Shoe(6).cards
+    state = rules.deal(rules.Rules(), shoe, 0, 10)
+    data = rules.pack(state)
+
+    cases = {
+        'Deck.draw': ('deck.draw()', lambda: {'deck': Deck()}, 52),
+        'Hand.get_value': ('hand.get_value()', lambda: {'hand': hand}, 1000),
+        'rules.pack': ('pack(state)', lambda: {'pack': rules.pack, 'state': state}, 1000),
+        'rules.unpack': ('unpack(data, shoe, 4)',
+                         lambda: {'unpack': rules.unpack, 'data': data, 'shoe': shoe}, 1000),
+        # a different round from the same shoe every call
+        'rules.play_round': ('play_round(table_rules, shoe, next(positions), 10)',
+                             lambda: {'play_round': rules.play_round, 'table_rules': rules.Rules(),
+                                      'shoe': Shoe(6).cards,
+                                      'positions': itertools.cycle(range(0, 300, 5))}, 100),
+    }
+    results = {}
+    for name, (stmt, make_globals, number) in cases.items():
+        times = []
+        for _ in range(200):
+            timer = timeit.Timer(stmt, globals=make_globals())
+            times.append(timer.timeit(number) / number)
+        results[name] = {'median_us': statistics.median(times) * 1e6,
+                         'min_us': min(times) * 1e6}
+    return results
+
+
+def sample_session():
+    # The session in the middle of a round, as the game routes leave it
+    import uuid
+    from BJ_classes import Shoe
+    import rules
+
+    shoe = Shoe(6)
+    state = rules.deal(rules.Rules(), shoe.cards, 0, 50)
+    return {'user_id': 42, 'username': 'bench-player', 'shoe_id': uuid.uuid4().hex,
+            'shoe_pos': state.pos, 'running_count': 1, 'bet': 50, 'round_key': uuid.uuid4().hex,
+            'round_step': 0, 'round_started': '2026-01-01T12:00:00.000000+00:00',
+            'true_count': 0.35, 'play': rules.pack(state)}
+
+
+def legacy_session():
+    # The same round before the rules engine, the hands as card dicts and the
+    # whole deck along in the cookie before the shoe moved server side
+    from BJ_classes import Deck, decode_card
+    import rules
+
+    def card_dicts(codes):
+        return [{'rank': rank, 'suit': suit} for rank, suit in map(decode_card, codes)]
+
+    session = sample_session()
+    state = rules.unpack(session.pop('play'))
+    session.update(player_hand=card_dicts(state.hands[0].cards), dealer_hand=card_dicts(state.dealer),
+                   result=None, game_over=False,
+                   deck=[{'rank': c.rank, 'suit': c.suit} for c in Deck().cards])
+    return session
+
+
+def codec_benchmarks():
+    # Size and speed of the signed session cookie, Flask's JSON cookie against the codec
+    from flask.sessions import SecureCookieSessionInterface
+    from app import app
+    from session_codec import CompactSessionInterface
+
+    current = sample_session()
+    legacy = legacy_session()
+    interfaces = {
+        'json': SecureCookieSessionInterface(),
+        'compact': CompactSessionInterface(compress=False),
+        # compact, then zlib when it helps
+        'zlib': CompactSessionInterface(compress=True),
+    }
+    results = {}
+    for (name, interface), (suffix, data) in itertools.product(
+            interfaces.items(), (('', current), (' legacy', legacy))):
+        serializer = interface.get_signing_serializer(app)
+        cookie = serializer.dumps(data)
+        assert serializer.loads(cookie) == data
+        encode = timeit.repeat(lambda: serializer.dumps(data), number=200, repeat=20)
+        decode = timeit.repeat(lambda: serializer.loads(cookie), number=200, repeat=20)
+        results[name + suffix] = {'cookie_bytes': len(cookie),
+                         'encode_us': min(encode) / 200 * 1e6,
+                         'decode_us': min(decode) / 200 * 1e6}
+    return results
+
+
+def compare(results, baseline, tolerance):
+    # A benchmark regresses when its best run is slower than the baseline by more than
+    # tolerance, the minimum is far less noisy than the median on a shared CI machine
+    failed = []
+    for name, result in results.items():
+        if name in baseline:
+            limit = baseline[name]['min_us'] * (1 + tolerance)
+            if result['min_us'] > limit:
+                failed.append(f"{name}: {result['min_us']:.3f}us > {limit:.3f}us")
+    return failed
+
+
+def print_table(rows, columns):
+    print(f"{'':<16}" + ''.join(f"{c:>14}" for c in columns))
+    for name, row in rows.items():
+        print(f"{name:<16}" + ''.join(f"{row[c]:>14.3f}" for c in columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the blackjack app")
+    sub = parser.add_subparsers(dest='mode', required=True)
+    app_parser = sub.add_parser('app', help="drive the app routes and report latency per route")
+    app_parser.add_argument('--rounds', type=int, default=100)
+    app_parser.add_argument('--players', type=int, default=1)
+    app_parser.add_argument('--server', action='store_true', help="use a real WSGI server on localhost")
+    app_parser.add_argument('--json', action='store_true')
+    micro_parser = sub.add_parser('micro', help="time the game helpers")
+    micro_parser.add_argument('--save', help="write the results as a baseline file")
+    micro_parser.add_argument('--compare', help="fail when slower than this baseline file")
+    micro_parser.add_argument('--tolerance', type=float, default=0.25)
+    micro_parser.add_argument('--json', action='store_true')
+    codec_parser = sub.add_parser('codec', help="compare session cookie codecs")
+    codec_parser.add_argument('--json', action='store_true')
+    args = parser.parse_args(argv)
+
+    if args.mode == 'app':
+        rows = run_app_benchmark(args.rounds, args.server, args.players)
+        if args.json:
+            print(json.dumps(rows))
+        else:
+            print_table(rows, ['requests', 'p50_ms', 'p95_ms', 'p99_ms', 'req_per_sec',
+                               'cookie_bytes', 'queries'])
+        return 0
+
+    if args.mode == 'codec':
+        rows = codec_benchmarks()
+        if args.json:
+            print(json.dumps(rows))
+        else:
+            print_table(rows, ['cookie_bytes', 'encode_us', 'decode_us'])
+        return 0
+
+    results = micro_benchmarks()
+    if args.json:
+        print(json.dumps(results))
+    else:
+        print_table(results, ['median_us', 'min_us'])
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            failed = compare(results, json.load(f), args.tolerance)
+        for line in failed:
+            print(f"REGRESSION {line}")
+        return 1 if failed else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
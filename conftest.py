@@ -0,0 +1,36 @@
+import os
+import pytest
+
+# The app reads its config at import time
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('SECRET_KEY', 'test-secret')
+# cheap hashes keep the tests fast
+os.environ.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+
+
+@pytest.fixture
+def app():
+    from app import app as flask_app
+    from database import db
+
+    flask_app.config['TESTING'] = True
+    # every test starts with fresh login limits and no shared tables
+    flask_app.extensions.pop('login_limits', None)
+    flask_app.extensions.pop('tables', None)
+    with flask_app.app_context():
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def player(client):
+    client.post('/register', data={'username': 'player', 'password': 'secret'})
+    client.post('/login', data={'username': 'player', 'password': 'secret'})
+    return client
@@ -0,0 +1,148 @@
+import argparse
+import json
+import statistics
+import sys
+from collections import defaultdict
+from BJ_classes import RANKS
+
+# Card counting. A CountTracker is attached to a Shoe or Deck (its tracker
+# attribute) and sees every card as it is drawn, so the running count, true
+# count and penetration are always ready without looking at the shoe again.
+# The analysis replays the ledger and flags players whose bets follow the count.
+#   python counting.py analyze [--min-rounds 30] [--spread 4] [--correlation 0.5]
+
+
+def _tags(ace, tens, *pips):
+    # Tag of every card code, pips are the tags of 2 to 9
+    points = {'Ace': ace, 'Jack': tens, 'Queen': tens, 'King': tens, '10': tens}
+    points.update(zip(('2', '3', '4', '5', '6', '7', '8', '9'), pips))
+    return tuple(points[RANKS[code >> 2]] for code in range(52))
+
+
+SYSTEMS = {
+    'hi-lo': _tags(-1, -1, 1, 1, 1, 1, 1, 0, 0, 0),
+    'ko': _tags(-1, -1, 1, 1, 1, 1, 1, 1, 0, 0),
+    'hi-opt-1': _tags(0, -1, 0, 1, 1, 1, 1, 0, 0, 0),
+    'hi-opt-2': _tags(0, -2, 1, 1, 2, 2, 1, 1, 0, 0),
+    'omega-2': _tags(0, -2, 1, 1, 2, 2, 2, 1, 0, -1),
+    'zen': _tags(-1, -2, 1, 1, 2, 2, 2, 1, 0, 0),
+}
+
+
+class CountTracker:
+    __slots__ = ("system", "tags", "total_cards", "running", "seen")
+
+    def __init__(self, system='hi-lo', num_decks=6, running=0, seen=0):
+        if system not in SYSTEMS:
+            raise ValueError(f"Unknown count system {system!r}")
+        self.system = system
+        self.tags = SYSTEMS[system]
+        self.total_cards = num_decks * 52
+        self.running = running
+        self.seen = seen
+
+    def see(self, code):
+        self.running += self.tags[code]
+        self.seen += 1
+
+    def see_all(self, codes):
+        tags = self.tags
+        self.running += sum(tags[code] for code in codes)
+        self.seen += len(codes)
+
+    def reset(self):
+        self.running = 0
+        self.seen = 0
+
+    def remaining_decks(self):
+        return (self.total_cards - self.seen) / 52
+
+    def true_count(self):
+        # Never divide by less than one card, a shoe dealt to the end keeps a finite count
+        return self.running * 52 / max(self.total_cards - self.seen, 1)
+
+    def penetration(self):
+        return self.seen / self.total_cards
+
+
+# ---------- bet spread analysis ----------
+
+def bet_spread(rounds, min_rounds=30, high_count=2.0, spread_limit=4.0, min_correlation=0.5):
+    # rounds are (player, bet, true count at bet time). A player is flagged when
+    # the average bet at a high count is spread_limit times the average bet at a
+    # count of zero or less and the bets follow the count closely
+    by_player = defaultdict(list)
+    for player, bet, true_count in rounds:
+        by_player[player].append((bet, true_count))
+
+    report = []
+    for player, rows in by_player.items():
+        if len(rows) < min_rounds:
+            continue
+        low = [bet for bet, count in rows if count <= 0]
+        high = [bet for bet, count in rows if count >= high_count]
+        if not low or not high:
+            continue
+        spread = statistics.fmean(high) / statistics.fmean(low)
+        try:
+            correlation = statistics.correlation([count for _, count in rows],
+                                                 [bet for bet, _ in rows])
+        except statistics.StatisticsError:  # the same bet every round
+            correlation = 0.0
+        report.append({
+            'player': player,
+            'rounds': len(rows),
+            'low_bet': statistics.fmean(low),
+            'high_bet': statistics.fmean(high),
+            'spread': spread,
+            'correlation': correlation,
+            'flagged': spread >= spread_limit and correlation >= min_correlation,
+        })
+    report.sort(key=lambda row: (not row['flagged'], -row['spread']))
+    return report
+
+
+def stored_rounds():
+    # Rounds of the ledger that know their count, read in batches
+    from database import db, User, GameRound
+
+    query = (db.select(User.username, GameRound.bet, GameRound.true_count)
+             .join(User, User.id == GameRound.user_id)
+             .where(GameRound.true_count.is_not(None))
+             .order_by(GameRound.id)
+             .execution_options(yield_per=1000))
+    return db.session.execute(query)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Card counting tools")
+    sub = parser.add_subparsers(dest='mode', required=True)
+    analyze = sub.add_parser('analyze', help="flag bets that follow the true count")
+    analyze.add_argument('--min-rounds', type=int, default=30)
+    analyze.add_argument('--high-count', type=float, default=2.0)
+    analyze.add_argument('--spread', type=float, default=4.0)
+    analyze.add_argument('--correlation', type=float, default=0.5)
+    analyze.add_argument('--all', action='store_true', help="list every player, not only the flagged ones")
+    analyze.add_argument('--json', action='store_true')
+    args = parser.parse_args(argv)
+
+    from app import app
+
+    with app.app_context():
+        report = bet_spread(stored_rounds(), args.min_rounds, args.high_count,
+                            args.spread, args.correlation)
+    if not args.all:
+        report = [row for row in report if row['flagged']]
+    if args.json:
+        print(json.dumps(report))
+        return 0
+    print(f"{'player':<20}{'rounds':>8}{'low bet':>10}{'high bet':>10}{'spread':>8}{'corr':>7}")
+    for row in report:
+        mark = '  FLAGGED' if row['flagged'] else ''
+        print(f"{row['player']:<20}{row['rounds']:>8}{row['low_bet']:>10.1f}{row['high_bet']:>10.1f}"
+              f"{row['spread']:>8.1f}{row['correlation']:>7.2f}{mark}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,69 @@
 import os
+import logging
+from datetime import datetime, timezone
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import update, case, cast, literal_column, text
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.exc import IntegrityError
 from dotenv import load_dotenv
 
 load_dotenv()
 
 db = SQLAlchemy() 
 
+logger = logging.getLogger(__name__)
+
+# Pool settings read from the environment, for example with several workers:
+#   DB_POOL_SIZE=5 DB_MAX_OVERFLOW=10 DB_POOL_RECYCLE=1800 DB_STATEMENT_TIMEOUT_MS=5000
+def engine_options(url, env=os.environ):
+    options = {
+        'pool_pre_ping': env.get('DB_POOL_PRE_PING', '1') == '1',
+        'pool_recycle': int(env.get('DB_POOL_RECYCLE', 1800)),
+    }
+    # SQLite picks its own pool, sizes only apply to server databases
+    if url and not url.startswith('sqlite'):
+        options['pool_size'] = int(env.get('DB_POOL_SIZE', 5))
+        options['max_overflow'] = int(env.get('DB_MAX_OVERFLOW', 10))
+        options['pool_timeout'] = int(env.get('DB_POOL_TIMEOUT', 30))
+    timeout = env.get('DB_STATEMENT_TIMEOUT_MS')
+    if timeout and url and url.startswith('postgres'):
+        options['connect_args'] = {'options': f'-c statement_timeout={int(timeout)}'}
+    return options
+
+def configure_database(app, env=os.environ):
+    url = app.config.get('SQLALCHEMY_DATABASE_URI')
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(url, env))
+    # Read-only pages can be served from a replica
+    replica_url = env.get('DATABASE_REPLICA_URL')
+    if replica_url:
+        binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+        binds['replica'] = {'url': replica_url, **engine_options(replica_url, env)}
+
+def check_database(app):
+    # Startup self-check: log the pool of every engine and make sure it answers
+    with app.app_context():
+        for name, engine in db.engines.items():
+            pool = engine.pool
+            size = pool.size() if hasattr(pool, 'size') else None
+            logger.info("Database %s: %s pool=%s size=%s overflow=%s recycle=%s pre_ping=%s",
+                        name or 'default', engine.url.render_as_string(hide_password=True),
+                        type(pool).__name__, size, getattr(pool, '_max_overflow', None),
+                        pool._recycle, pool._pre_ping)
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text('SELECT 1'))
+            except Exception as e:
+                logger.error("Database %s is not reachable: %s", name or 'default', e)
+
+def read_user(user_id):
+    # Served by the replica when one is configured, the user comes back detached
+    engine = db.engines.get('replica')
+    if engine is None:
+        return db.session.get(User, user_id)
+    with Session(engine) as replica:
+        return replica.get(User, user_id)
+
 class User(db.Model):
     __tablename__ = 'users'
 
@@ -17,10 +75,146 @@ class User(db.Model):
     wins = db.Column(db.Integer, default=0)
     losses = db.Column(db.Integer, default=0)
     money = db.Column(db.Integer, default=1000)
-    
+
+    @hybrid_property
+    def win_rate(self):
+        played = (self.wins or 0) + (self.losses or 0)
+        return self.wins / played if played else 0.0
+
+    @win_rate.expression
+    def win_rate(cls):
+        # The constants are written into the SQL, a bound parameter would make
+        # the expression differ from the one in ix_users_win_rate_id
+        played = cls.wins + cls.losses
+        return case((played > literal_column('0'), cast(cls.wins, db.Float) / played),
+                    else_=literal_column('0.0'))
+
     def __repr__(self):
         return f'<User {self.username}>'
 
+# Leaderboard orderings, the id breaks ties so keyset pages never overlap
+db.Index('ix_users_money_id', User.money, User.id)
+db.Index('ix_users_win_rate_id', User.win_rate, User.id)
+
+class GameRound(db.Model):
+    __tablename__ = 'game_rounds'
+
+    # Append-only ledger, one row per settled round
+    id = db.Column(db.Integer, primary_key=True)
+    # Generated when the bet is placed, a round can only be settled once
+    round_key = db.Column(db.String(32), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    bet = db.Column(db.Integer, nullable=False)
+    outcome = db.Column(db.String(10), nullable=False)
+    payout = db.Column(db.Integer, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False)
+    settled_at = db.Column(db.DateTime, nullable=False)
+    # True count of the shoe when the bet was placed, for the bet spread analysis
+    true_count = db.Column(db.Float)
+
+    def __repr__(self):
+        return f'<GameRound {self.round_key} {self.outcome}>'
+
+class RoundMove(db.Model):
+    __tablename__ = 'round_moves'
+    __table_args__ = (db.UniqueConstraint('round_key', 'step'),)
+
+    # Every move of a round in play and what it cost. A session cookie sent
+    # again holds the same step, the move cannot be made (or paid) twice
+    id = db.Column(db.Integer, primary_key=True)
+    round_key = db.Column(db.String(32), nullable=False)
+    step = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    action = db.Column(db.String(12), nullable=False)
+    cost = db.Column(db.Integer, nullable=False)
+    played_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<RoundMove {self.round_key} {self.step} {self.action}>'
+
+class ShoeState(db.Model):
+    __tablename__ = 'shoes'
+
+    # One row per shoe, rewritten only when the shoe is shuffled
+    id = db.Column(db.String(32), primary_key=True)
+    num_decks = db.Column(db.Integer, nullable=False)
+    penetration = db.Column(db.Float, nullable=False)
+    cards = db.Column(db.LargeBinary, nullable=False)
+
+    def __repr__(self):
+        return f'<ShoeState {self.id}>'
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+# Balance changes are single UPDATE statements so two requests of the
+# same user can never overwrite each other's result
+def take_bet(user_id, amount):
+    result = db.session.execute(
+        update(User)
+        .where(User.id == user_id, User.money >= amount)
+        .values(money=User.money - amount)
+        .execution_options(synchronize_session=False))
+    db.session.commit()
+    return result.rowcount == 1
+
+def record_move(user_id, round_key, step, action, cost):
+    # The move row and its extra bet are committed together. None when the move
+    # may be made, 'played' when this step of the round was made already or the
+    # round is settled, 'money' when the extra bet cannot be paid
+    settled = db.session.execute(
+        db.select(GameRound.id).where(GameRound.round_key == round_key)).first()
+    if settled is not None:
+        return 'played'
+    db.session.add(RoundMove(round_key=round_key, step=step, user_id=user_id,
+                             action=action, cost=cost, played_at=utcnow()))
+    try:
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        return 'played'
+    if cost:
+        result = db.session.execute(
+            update(User)
+            .where(User.id == user_id, User.money >= cost)
+            .values(money=User.money - cost)
+            .execution_options(synchronize_session=False))
+        if result.rowcount != 1:
+            db.session.rollback()
+            return 'money'
+    db.session.commit()
+    return None
+
+def refund_bet(user_id, amount):
+    db.session.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(money=User.money + amount)
+        .execution_options(synchronize_session=False))
+    db.session.commit()
+
+def settle_round(user_id, round_key, bet, outcome, payout, started_at, true_count=None):
+    # The ledger row and the balance change are committed together,
+    # settling the same round twice fails on the unique round_key
+    db.session.add(GameRound(round_key=round_key, user_id=user_id, bet=bet,
+                             outcome=outcome, payout=payout,
+                             started_at=started_at, settled_at=utcnow(),
+                             true_count=true_count))
+    try:
+        db.session.flush()
+        db.session.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(money=User.money + payout,
+                    wins=User.wins + (1 if outcome == 'win' else 0),
+                    losses=User.losses + (1 if outcome == 'loss' else 0))
+            .execution_options(synchronize_session=False))
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    return True
+
 def init_db(app):
     with app.app_context():
         db.create_all()
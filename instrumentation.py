@@ -0,0 +1,163 @@
+import cProfile
+import os
+import pstats
+import random
+import threading
+import time
+from collections import defaultdict
+from flask import g, has_request_context, request, Response
+from flask.signals import before_render_template, template_rendered
+from sqlalchemy import event
+
+# Opt-in per route timings: wall time, SQL, template rendering and session
+# load/save, exposed as Prometheus text on /metrics. A sample of requests
+# can also be profiled with cProfile, the samples of a route are merged into
+# one <route>.prof file that is rewritten as samples come in.
+
+METRICS = (
+    ('request_seconds', "Wall time of the request"),
+    ('sql_seconds', "Time spent executing SQL"),
+    ('sql_queries', "SQL statements executed"),
+    ('render_seconds', "Time spent rendering templates"),
+    ('session_load_seconds', "Time spent loading the session"),
+    ('session_save_seconds', "Time spent saving the session"),
+    ('session_bytes', "Size of the session cookie sent back"),
+)
+
+
+class RouteMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = defaultdict(int)
+        self._sums = defaultdict(lambda: dict.fromkeys((name for name, _ in METRICS), 0.0))
+
+    def record(self, route, values):
+        with self._lock:
+            self._counts[route] += 1
+            sums = self._sums[route]
+            for name, value in values.items():
+                sums[name] += value
+
+    def render(self):
+        with self._lock:
+            counts = dict(self._counts)
+            sums = {route: dict(values) for route, values in self._sums.items()}
+        lines = []
+        for name, help_text in METRICS:
+            lines.append(f"# HELP bj_{name} {help_text}")
+            lines.append(f"# TYPE bj_{name} summary")
+            for route in sorted(counts):
+                lines.append(f'bj_{name}_sum{{route="{route}"}} {sums[route][name]}')
+                lines.append(f'bj_{name}_count{{route="{route}"}} {counts[route]}')
+        return "\n".join(lines) + "\n"
+
+
+class TimedSessionInterface:
+    # Wraps the app's session interface to time loading and saving the session
+    def __init__(self, inner):
+        self.inner = inner
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def open_session(self, app, req):
+        # The session is opened first thing in a request, the request timer starts here
+        started = time.perf_counter()
+        session = self.inner.open_session(app, req)
+        g._started = started
+        _request_metrics()['session_load_seconds'] += time.perf_counter() - started
+        return session
+
+    def save_session(self, app, session, response):
+        started = time.perf_counter()
+        self.inner.save_session(app, session, response)
+        values = _request_metrics()
+        values['session_save_seconds'] += time.perf_counter() - started
+        cookie_name = app.config['SESSION_COOKIE_NAME']
+        for header in response.headers.getlist('Set-Cookie'):
+            if header.startswith(cookie_name + '='):
+                values['session_bytes'] += len(header.split(';', 1)[0]) - len(cookie_name) - 1
+
+
+def _route():
+    return request.endpoint or 'unmatched'
+
+
+def _request_metrics():
+    if '_metrics' not in g:
+        g._metrics = dict.fromkeys((name for name, _ in METRICS), 0.0)
+    return g._metrics
+
+
+def init_instrumentation(app):
+    if not app.config.get('INSTRUMENTATION'):
+        return None
+    metrics = RouteMetrics()
+    sample_rate = app.config.get('PROFILE_SAMPLE_RATE', 0.0)
+    profile_dir = app.config.get('PROFILE_DIR') or 'profiles'
+    app.session_interface = TimedSessionInterface(app.session_interface)
+    profiles = {}
+    profiles_lock = threading.Lock()
+
+    @app.before_request
+    def start_profiler():
+        if sample_rate and random.random() < sample_rate:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                g._profiler = profiler
+            except ValueError:  # another profiler is already running
+                pass
+
+    @app.teardown_request
+    def finish_request(exc):
+        if '_started' not in g:
+            return
+        values = _request_metrics()
+        values['request_seconds'] = time.perf_counter() - g._started
+        metrics.record(_route(), values)
+        profiler = g.pop('_profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            route = _route()
+            with profiles_lock:
+                if route in profiles:
+                    profiles[route].add(profiler)
+                else:
+                    profiles[route] = pstats.Stats(profiler)
+                os.makedirs(profile_dir, exist_ok=True)
+                profiles[route].dump_stats(os.path.join(profile_dir, f"{route}.prof"))
+
+    def sql_started(conn, cursor, statement, parameters, context, executemany):
+        conn.info['_query_started'] = time.perf_counter()
+
+    def sql_finished(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop('_query_started', None)
+        if started is not None and has_request_context():
+            values = _request_metrics()
+            values['sql_seconds'] += time.perf_counter() - started
+            values['sql_queries'] += 1
+
+    # Only the engines of this app, another app in the process is not timed
+    if 'sqlalchemy' in app.extensions:
+        with app.app_context():
+            engines = list(app.extensions['sqlalchemy'].engines.values())
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', sql_started)
+            event.listen(engine, 'after_cursor_execute', sql_finished)
+
+    def render_started(sender, template, context, **extra):
+        g._render_started = time.perf_counter()
+
+    def render_finished(sender, template, context, **extra):
+        if '_render_started' in g:
+            _request_metrics()['render_seconds'] += time.perf_counter() - g.pop('_render_started')
+
+    before_render_template.connect(render_started, app, weak=False)
+    template_rendered.connect(render_finished, app, weak=False)
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    return metrics
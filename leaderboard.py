@@ -0,0 +1,107 @@
+import threading
+import time
+from sqlalchemy import func, tuple_
+from database import db, User, GameRound
+
+# Leaderboard pages and player stats are kept for a few seconds so heavy
+# traffic does not hit the users table every time. Settling a round drops
+# the cached pages straight away (only in the process that settled it).
+CACHE_TTL = 10
+MAX_ENTRIES = 1000
+MAX_LIMIT = 100
+
+RANKINGS = {
+    'money': (User.money, int),
+    'win_rate': (User.win_rate, float),
+}
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def _cached(key, loader):
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(key)
+        if entry and entry[0] > now:
+            return entry[1]
+    value = loader()
+    with _lock:
+        if len(_cache) >= MAX_ENTRIES:
+            for old_key, (expires, _) in list(_cache.items()):
+                if expires <= now:
+                    del _cache[old_key]
+        _cache[key] = (now + CACHE_TTL, value)
+    return value
+
+
+def invalidate(username=None):
+    with _lock:
+        for key in list(_cache):
+            if key[0] == 'top' or (username and key == ('stats', username)):
+                del _cache[key]
+
+
+def parse_cursor(by, cursor):
+    # A cursor is the score and id of the last row of the previous page
+    if not cursor:
+        return None
+    score, _, user_id = cursor.rpartition(':')
+    return RANKINGS[by][1](score), int(user_id)
+
+
+def top_players(by='money', limit=10, after=None):
+    if by not in RANKINGS:
+        raise ValueError(f"Unknown ranking: {by}")
+    limit = max(1, min(limit, MAX_LIMIT))
+    return _cached(('top', by, limit, after), lambda: _load_top(by, limit, after))
+
+
+def _load_top(by, limit, after):
+    column = RANKINGS[by][0]
+    query = db.session.query(User.id, User.username, User.money, User.wins,
+                             User.losses, column.label('score'))
+    if after is not None:
+        # the plain bound lets the database seek into the index (SQLite only
+        # seeks on a row value of plain columns), the row value breaks ties
+        query = query.filter(column <= after[0], tuple_(column, User.id) < tuple_(*after))
+    rows = query.order_by(column.desc(), User.id.desc()).limit(limit).all()
+
+    players = [{'username': row.username,
+                'money': row.money,
+                'wins': row.wins,
+                'losses': row.losses,
+                'win_rate': row.score if by == 'win_rate' else _rate(row.wins, row.losses)}
+               for row in rows]
+    next_cursor = None
+    if len(rows) == limit:
+        next_cursor = f"{rows[-1].score}:{rows[-1].id}"
+    return {'by': by, 'players': players, 'next_cursor': next_cursor}
+
+
+def _rate(wins, losses):
+    played = (wins or 0) + (losses or 0)
+    return wins / played if played else 0.0
+
+
+def player_stats(username):
+    return _cached(('stats', username), lambda: _load_stats(username))
+
+
+def _load_stats(username):
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        return None
+    rounds, wagered, paid = db.session.query(
+        func.count(GameRound.id),
+        func.coalesce(func.sum(GameRound.bet), 0),
+        func.coalesce(func.sum(GameRound.payout), 0),
+    ).filter(GameRound.user_id == user.id).one()
+    return {'username': user.username,
+            'money': user.money,
+            'wins': user.wins,
+            'losses': user.losses,
+            'win_rate': user.win_rate,
+            'rounds': rounds,
+            'wagered': wagered,
+            'net': paid - wagered}
@@ -0,0 +1,386 @@
+import argparse
+import json
+import random
+import struct
+import sys
+import time
+from collections import namedtuple
+from BJ_classes import RANKS, RANK_POINTS, DEALER_STANDS_ON
+
+# Table rules as a state machine. A round is an immutable State and every
+# decision is a pure function from one State to the next: cards come from the
+# shoe's byte string at the state's position, nothing else is read or changed.
+# The web routes and the headless simulation below drive the same functions.
+#   python rules.py --hands 200000 [--h17] [--no-das] [--payout 1.2]
+# The first dealer card is the hole card, the second one is the upcard.
+
+Rules = namedtuple('Rules', ('dealer_hits_soft_17', 'double_after_split', 'resplit_aces',
+                             'hit_split_aces', 'max_hands', 'surrender', 'insurance',
+                             'blackjack_pays'),
+                   defaults=(False, True, False, False, 4, True, True, 1.5))
+
+PlayerHand = namedtuple('PlayerHand', ('cards', 'bet', 'doubled', 'split_aces', 'done', 'surrendered'),
+                        defaults=(False, False, False, False))
+
+# results holds (label, payout) per hand once the round is over
+State = namedtuple('State', ('cards', 'pos', 'phase', 'hands', 'active', 'dealer',
+                             'insurance', 'results'))
+
+INSURANCE, PLAYER, DONE = 'insurance', 'player', 'done'
+PHASES = (INSURANCE, PLAYER, DONE)
+ACTIONS = ('hit', 'stand', 'double', 'split', 'surrender', 'insurance', 'no_insurance')
+LABELS = ('blackjack', 'win', 'push', 'loss', 'bust', 'surrender')
+
+# Points of every card code, the ace counts 1
+_POINTS = tuple(RANK_POINTS[RANKS[code >> 2]] for code in range(52))
+
+
+class IllegalAction(ValueError):
+    pass
+
+
+class ShoeExhausted(Exception):
+    # The round needs a card past the end of the shoe, the caller shuffles
+    # and plays the move again from the top of the new shoe
+    pass
+
+
+def hand_value(cards):
+    hard = 0
+    aces = False
+    for code in cards:
+        points = _POINTS[code]
+        hard += points
+        aces = aces or points == 1
+    if aces and hard <= 11:
+        return hard + 10, True
+    return hard, False
+
+
+def is_blackjack(cards):
+    return len(cards) == 2 and hand_value(cards)[0] == 21
+
+
+def _draw(cards, pos):
+    if pos >= len(cards):
+        raise ShoeExhausted()
+    return cards[pos], pos + 1
+
+
+def deal(rules, cards, pos, bet):
+    # Player, player, dealer hole card, dealer upcard
+    if pos + 4 > len(cards):
+        raise ShoeExhausted()
+    state = State(cards, pos + 4, PLAYER, (PlayerHand((cards[pos], cards[pos + 1]), bet),),
+                  0, (cards[pos + 2], cards[pos + 3]), 0, ())
+    if rules.insurance and _POINTS[state.dealer[1]] == 1 and bet >= 2:
+        return state._replace(phase=INSURANCE)
+    return _after_peek(rules, state)
+
+
+def _after_peek(rules, state):
+    # The dealer checks the hole card before anybody plays, a natural ends the round
+    if is_blackjack(state.dealer) or is_blackjack(state.hands[0].cards):
+        return _finish(rules, state._replace(phase=PLAYER))
+    return _next_hand(rules, state._replace(phase=PLAYER))
+
+
+def _can_split(rules, state, hand):
+    if len(hand.cards) != 2 or len(state.hands) >= rules.max_hands:
+        return False
+    first, second = hand.cards
+    if _POINTS[first] != _POINTS[second]:
+        return False
+    return not hand.split_aces or rules.resplit_aces
+
+
+def legal_actions(rules, state):
+    if state.phase == INSURANCE:
+        return ('insurance', 'no_insurance')
+    if state.phase != PLAYER:
+        return ()
+    hand = state.hands[state.active]
+    actions = ['stand'] if hand.split_aces and not rules.hit_split_aces else ['hit', 'stand']
+    if len(hand.cards) == 2:
+        split = len(state.hands) > 1
+        if not hand.split_aces and (not split or rules.double_after_split):
+            actions.append('double')
+        if _can_split(rules, state, hand):
+            actions.append('split')
+        if not split and rules.surrender:
+            actions.append('surrender')
+    return tuple(actions)
+
+
+def cost(state, action):
+    # Money the player puts on the table for the action, on top of the first bet
+    if action in ('double', 'split'):
+        return state.hands[state.active].bet
+    if action == 'insurance':
+        return state.hands[0].bet // 2
+    return 0
+
+
+def apply(rules, state, action):
+    if action not in legal_actions(rules, state):
+        raise IllegalAction(f"{action} is not allowed now")
+    if action == 'insurance':
+        return _after_peek(rules, state._replace(insurance=state.hands[0].bet // 2))
+    if action == 'no_insurance':
+        return _after_peek(rules, state)
+
+    hands = list(state.hands)
+    hand = hands[state.active]
+    pos = state.pos
+    if action == 'hit':
+        card, pos = _draw(state.cards, pos)
+        hand = hand._replace(cards=hand.cards + (card,))
+        hand = hand._replace(done=hand_value(hand.cards)[0] >= 21)
+        hands[state.active] = hand
+    elif action == 'stand':
+        hands[state.active] = hand._replace(done=True)
+    elif action == 'double':
+        card, pos = _draw(state.cards, pos)
+        hands[state.active] = hand._replace(cards=hand.cards + (card,), bet=hand.bet * 2,
+                                            doubled=True, done=True)
+    elif action == 'surrender':
+        hands[state.active] = hand._replace(surrendered=True, done=True)
+    else:
+        # split, the second card of each new hand is dealt when the hand is played
+        aces = _POINTS[hand.cards[0]] == 1
+        hands[state.active:state.active + 1] = [PlayerHand((code,), hand.bet, split_aces=aces)
+                                                for code in hand.cards]
+    return _next_hand(rules, state._replace(pos=pos, hands=tuple(hands)))
+
+
+def _next_hand(rules, state):
+    # Moves on to the first hand that still needs a decision, or ends the round
+    hands = list(state.hands)
+    pos = state.pos
+    for index, hand in enumerate(hands):
+        if hand.done:
+            continue
+        if len(hand.cards) == 1:
+            card, pos = _draw(state.cards, pos)
+            hand = hand._replace(cards=hand.cards + (card,))
+        state = state._replace(pos=pos, hands=tuple(hands[:index]) + (hand,) + tuple(hands[index + 1:]),
+                               active=index)
+        # 21, or split aces that may take no more cards, stand on their own
+        if hand_value(hand.cards)[0] >= 21 or legal_actions(rules, state) == ('stand',):
+            hands[index] = hand._replace(done=True)
+            state = state._replace(hands=tuple(hands))
+            continue
+        return state
+    return _finish(rules, state._replace(pos=pos, hands=tuple(hands)))
+
+
+def _finish(rules, state):
+    dealer = state.dealer
+    pos = state.pos
+    dealer_blackjack = is_blackjack(dealer)
+    natural = len(state.hands) == 1 and is_blackjack(state.hands[0].cards)
+    live = any(not h.surrendered and hand_value(h.cards)[0] <= 21 for h in state.hands)
+    if live and not natural and not dealer_blackjack:
+        while True:
+            value, soft = hand_value(dealer)
+            if value > DEALER_STANDS_ON or (value == DEALER_STANDS_ON
+                                            and not (soft and rules.dealer_hits_soft_17)):
+                break
+            card, pos = _draw(state.cards, pos)
+            dealer += (card,)
+    dealer_score = hand_value(dealer)[0]
+
+    results = []
+    for hand in state.hands:
+        bet = hand.bet
+        score = hand_value(hand.cards)[0]
+        if hand.surrendered:
+            results.append(('surrender', bet // 2))
+        elif natural and dealer_blackjack:
+            results.append(('push', bet))
+        elif natural:
+            results.append(('blackjack', bet + int(bet * rules.blackjack_pays)))
+        elif dealer_blackjack:
+            results.append(('loss', 0))
+        elif score > 21:
+            results.append(('bust', 0))
+        elif dealer_score > 21 or score > dealer_score:
+            results.append(('win', bet * 2))
+        elif score < dealer_score:
+            results.append(('loss', 0))
+        else:
+            results.append(('push', bet))
+    return state._replace(phase=DONE, pos=pos, dealer=dealer, results=tuple(results))
+
+
+def wagered(state):
+    return sum(hand.bet for hand in state.hands) + state.insurance
+
+
+def payout(state):
+    # Everything paid back to the player, insurance pays 2:1 against a dealer natural
+    total = sum(paid for _, paid in state.results)
+    if state.insurance and is_blackjack(state.dealer):
+        total += state.insurance * 3
+    return total
+
+
+# ---------- session format, the shoe itself is stored elsewhere ----------
+
+_HEADER = struct.Struct('!BBIB')
+_HAND = struct.Struct('!IBB')
+_RESULT = struct.Struct('!BI')
+
+
+def pack(state):
+    out = bytearray(_HEADER.pack(PHASES.index(state.phase), state.active, state.insurance,
+                                 len(state.dealer)))
+    out += bytes(state.dealer)
+    out.append(len(state.hands))
+    for hand in state.hands:
+        flags = hand.doubled | hand.split_aces << 1 | hand.done << 2 | hand.surrendered << 3
+        out += _HAND.pack(hand.bet, flags, len(hand.cards)) + bytes(hand.cards)
+    for label, paid in state.results:
+        out += _RESULT.pack(LABELS.index(label), paid)
+    return bytes(out)
+
+
+def unpack(data, cards=None, pos=0):
+    # Without the shoe's cards the state can be shown but not played
+    phase, active, insurance, count = _HEADER.unpack_from(data)
+    offset = _HEADER.size + count
+    dealer = tuple(data[_HEADER.size:offset])
+    hands = []
+    for _ in range(data[offset]):
+        bet, flags, count = _HAND.unpack_from(data, offset + 1)
+        offset += 1 + _HAND.size
+        hands.append(PlayerHand(tuple(data[offset:offset + count]), bet, bool(flags & 1),
+                                bool(flags & 2), bool(flags & 4), bool(flags & 8)))
+        offset += count - 1
+    offset += 1
+    results = tuple((LABELS[label], paid) for label, paid in
+                    (_RESULT.unpack_from(data, at) for at in range(offset, len(data), _RESULT.size)))
+    return State(cards, pos, PHASES[phase], tuple(hands), active, dealer, insurance, results)
+
+
+# ---------- headless play ----------
+
+# Basic strategy for several decks, (first, last) dealer upcards with the ace as 11
+_SOFT_DOUBLE = {13: (5, 6), 14: (5, 6), 15: (4, 6), 16: (4, 6), 17: (3, 6), 18: (3, 6)}
+_HARD_DOUBLE = {9: (3, 6), 10: (2, 9), 11: (2, 10)}
+_SPLIT = {1: (2, 11), 8: (2, 11), 9: (2, 9), 7: (2, 7), 6: (2, 6), 4: (5, 6), 3: (2, 7), 2: (2, 7)}
+
+
+def basic_strategy(rules, state):
+    if state.phase == INSURANCE:
+        return 'no_insurance'
+    actions = legal_actions(rules, state)
+    hand = state.hands[state.active]
+    up = _POINTS[state.dealer[1]]
+    up = 11 if up == 1 else up
+    value, soft = hand_value(hand.cards)
+
+    if 'split' in actions:
+        low, high = _SPLIT.get(_POINTS[hand.cards[0]], (0, 0))
+        if low <= up <= high and not (_POINTS[hand.cards[0]] == 9 and up == 7):
+            if rules.double_after_split or _POINTS[hand.cards[0]] not in (2, 3, 4, 6):
+                return 'split'
+    if 'surrender' in actions and not soft and (
+            (value == 16 and up >= 9) or (value == 15 and up == 10)):
+        return 'surrender'
+    if soft:
+        low, high = _SOFT_DOUBLE.get(value, (0, 0))
+        if low <= up <= high:
+            return 'double' if 'double' in actions else ('stand' if value == 18 else 'hit')
+        if value >= 19 or (value == 18 and up <= 8):
+            return 'stand'
+        return 'hit' if 'hit' in actions else 'stand'
+    low, high = _HARD_DOUBLE.get(value, (0, 0))
+    if value == 11 and rules.dealer_hits_soft_17:
+        high = 11
+    if low <= up <= high:
+        return 'double' if 'double' in actions else 'hit'
+    if value >= 17 or (value >= 13 and up <= 6) or (value == 12 and 4 <= up <= 6):
+        return 'stand'
+    return 'hit' if 'hit' in actions else 'stand'
+
+
+def play_round(rules, cards, pos, bet, policy=basic_strategy):
+    state = deal(rules, cards, pos, bet)
+    while state.phase != DONE:
+        state = apply(rules, state, policy(rules, state))
+    return state
+
+
+def simulate(rules, hands, num_decks=6, penetration=0.75, seed=None, policy=basic_strategy):
+    if hands < 1:
+        raise ValueError("Simulate at least one hand")
+    rng = random.Random(seed)
+    codes = list(range(52)) * num_decks
+    cut_card = int(len(codes) * penetration)
+    pos = len(codes)
+    results = dict.fromkeys(LABELS, 0)
+    total_wagered = total_paid = 0
+    started = time.perf_counter()
+    for _ in range(hands):
+        if pos >= cut_card:
+            rng.shuffle(codes)
+            cards, pos = bytes(codes), 0
+        try:
+            state = play_round(rules, cards, pos, 2, policy)
+        except ShoeExhausted:
+            # a round the rest of the shoe cannot finish is dealt from a new one
+            rng.shuffle(codes)
+            cards = bytes(codes)
+            state = play_round(rules, cards, 0, 2, policy)
+        pos = state.pos
+        total_wagered += wagered(state)
+        total_paid += payout(state)
+        for label, _ in state.results:
+            results[label] += 1
+    elapsed = time.perf_counter() - started
+    return {
+        'hands': hands,
+        'wagered': total_wagered,
+        'net': total_paid - total_wagered,
+        # per unit of the first bet, the simulation bets 2 so insurance is possible
+        'ev': (total_paid - total_wagered) / (2 * hands),
+        'results': results,
+        'seconds': elapsed,
+        'hands_per_second': hands / elapsed if elapsed else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play blackjack rounds with basic strategy")
+    parser.add_argument('--hands', type=int, default=100000)
+    parser.add_argument('--decks', type=int, default=6)
+    parser.add_argument('--penetration', type=float, default=0.75)
+    parser.add_argument('--h17', action='store_true', help="the dealer hits soft 17")
+    parser.add_argument('--no-das', action='store_true', help="no double after split")
+    parser.add_argument('--resplit-aces', action='store_true')
+    parser.add_argument('--no-surrender', action='store_true')
+    parser.add_argument('--payout', type=float, default=1.5, help="blackjack payout, 1.5 for 3:2")
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args(argv)
+    if args.hands < 1:
+        parser.error("--hands must be at least 1")
+
+    rules = Rules(dealer_hits_soft_17=args.h17, double_after_split=not args.no_das,
+                  resplit_aces=args.resplit_aces, surrender=not args.no_surrender,
+                  blackjack_pays=args.payout)
+    stats = simulate(rules, args.hands, args.decks, args.penetration, args.seed)
+    if args.json:
+        print(json.dumps(stats))
+        return 0
+    print(f"hands         {stats['hands']}")
+    print(f"player edge   {stats['ev'] * 100:+.3f}%")
+    for label, count in stats['results'].items():
+        print(f"{label:<14}{count}")
+    print(f"hands/second  {stats['hands_per_second']:.0f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
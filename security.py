@@ -0,0 +1,82 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Password hashing off the request thread and login throttling.
+# Hashing runs in a small thread pool (hashlib releases the GIL while it
+# works), so a burst of logins can only keep that many cores busy. When the
+# pool and its queue are full the request is turned away instead of waiting.
+
+
+class HasherBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    def __init__(self, method='scrypt', salt_length=16, workers=4, queue_limit=32, timeout=10):
+        self.method = method
+        self.salt_length = salt_length
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password')
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+        # werkzeug fills in the default parameters, e.g. 'scrypt' -> 'scrypt:32768:8:1'
+        self._prefix = generate_password_hash('', method, salt_length).split('$', 1)[0]
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            future = self._pool.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is free once the hash is done, not when the request stops
+        # waiting for it, a timed out hash still holds its worker
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            raise HasherBusy() from None
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        # True when the hash was made with other parameters than the configured ones
+        method, _, rest = pwhash.partition('$')
+        salt = rest.split('$', 1)[0]
+        return method != self._prefix or len(salt) != self.salt_length
+
+
+class TokenBucket:
+    # capacity attempts at once, refilled at rate tokens per second, per key
+    def __init__(self, capacity, rate, max_keys=100000):
+        self.capacity = capacity
+        self.rate = rate
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            if len(self._buckets) >= self.max_keys and key not in self._buckets:
+                self._prune(now)
+            self._buckets[key] = (tokens, now)
+            return allowed
+
+    def _prune(self, now):
+        # Buckets that have filled up again carry no information
+        full_after = self.capacity / self.rate
+        for key, (tokens, updated) in list(self._buckets.items()):
+            if now - updated >= full_after:
+                del self._buckets[key]
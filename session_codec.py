@@ -0,0 +1,126 @@
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSessionInterface
+from itsdangerous import URLSafeTimedSerializer
+from itsdangerous.encoding import base64_encode
+from itsdangerous.url_safe import URLSafeSerializerMixin
+from BJ_classes import RANKS, SUITS
+
+# Binary session payload. Card lists are stored one byte per card (the card code
+# from BJ_classes), the hex ids as 16 raw bytes and the packed round (rules.pack)
+# as it is, everything else stays compact tagged JSON. Signing and base64 are done by itsdangerous as for Flask's own
+# cookies. Cookies written by the JSON serializer are still read.
+#
+#   0x01 | (field, cards count, codes... | field, 16 bytes | field, length, bytes)* | 0xff | JSON
+
+MAGIC = b'\x01'
+END = 0xff
+CARD_FIELDS = ('player_hand', 'dealer_hand', 'deck')
+HEX_FIELDS = ('shoe_id', 'round_key')
+BYTES_FIELDS = ('play',)
+
+_CARDS = tuple({'rank': rank, 'suit': suit} for rank in RANKS for suit in SUITS)
+_CODES = {(card['rank'], card['suit']): code for code, card in enumerate(_CARDS)}
+
+
+def _card_codes(value):
+    # None when the value is not a list of cards the codec knows
+    if not isinstance(value, list) or len(value) > 255:
+        return None
+    try:
+        return bytes(_CODES[card['rank'], card['suit']] for card in value)
+    except (KeyError, TypeError):
+        return None
+
+
+def _hex_bytes(value):
+    if not isinstance(value, str) or len(value) != 32:
+        return None
+    try:
+        raw = bytes.fromhex(value)
+    except ValueError:
+        return None
+    # upper case ids would not come back the same
+    return raw if raw.hex() == value else None
+
+
+class CompactSessionSerializer:
+    def __init__(self):
+        self.json = TaggedJSONSerializer()
+
+    def dumps(self, value):
+        rest = dict(value)
+        out = bytearray(MAGIC)
+        for field, name in enumerate(CARD_FIELDS):
+            codes = _card_codes(rest.get(name))
+            if codes is not None:
+                del rest[name]
+                out += bytes((field, len(codes))) + codes
+        for field, name in enumerate(HEX_FIELDS, len(CARD_FIELDS)):
+            raw = _hex_bytes(rest.get(name))
+            if raw is not None:
+                del rest[name]
+                out.append(field)
+                out += raw
+        for field, name in enumerate(BYTES_FIELDS, len(CARD_FIELDS) + len(HEX_FIELDS)):
+            raw = rest.get(name)
+            if isinstance(raw, bytes) and len(raw) < 65536:
+                del rest[name]
+                out.append(field)
+                out += len(raw).to_bytes(2, 'big') + raw
+        out.append(END)
+        if rest:
+            out += self.json.dumps(rest).encode()
+        return bytes(out)
+
+    def loads(self, value):
+        if isinstance(value, str):
+            value = value.encode()
+        if value[:1] != MAGIC:
+            # a cookie from before the codec
+            return self.json.loads(value)
+        data = {}
+        pos = 1
+        while value[pos] != END:
+            field = value[pos]
+            if field < len(CARD_FIELDS):
+                count = value[pos + 1]
+                data[CARD_FIELDS[field]] = [dict(_CARDS[code]) for code in value[pos + 2:pos + 2 + count]]
+                pos += 2 + count
+            elif field < len(CARD_FIELDS) + len(HEX_FIELDS):
+                data[HEX_FIELDS[field - len(CARD_FIELDS)]] = value[pos + 1:pos + 17].hex()
+                pos += 17
+            else:
+                size = int.from_bytes(value[pos + 1:pos + 3], 'big')
+                data[BYTES_FIELDS[field - len(CARD_FIELDS) - len(HEX_FIELDS)]] = value[pos + 3:pos + 3 + size]
+                pos += 3 + size
+        if pos + 1 < len(value):
+            data.update(self.json.loads(value[pos + 1:]))
+        return data
+
+
+class CookieSerializer(URLSafeTimedSerializer):
+    # The payload is bytes, the signed cookie value is plain ASCII
+    def dumps(self, obj, salt=None):
+        return super().dumps(obj, salt).decode('ascii')
+
+
+class UncompressedCookieSerializer(CookieSerializer):
+    # The base class zlib compresses every payload that shrinks, this one never does
+    def dump_payload(self, obj):
+        return base64_encode(super(URLSafeSerializerMixin, self).dump_payload(obj))
+
+
+class CompactSessionInterface(SecureCookieSessionInterface):
+    serializer = CompactSessionSerializer()
+
+    def __init__(self, compress=True):
+        self.compress = compress
+
+    def get_signing_serializer(self, app):
+        if not app.secret_key:
+            return None
+        keys = list(app.config['SECRET_KEY_FALLBACKS'] or []) + [app.secret_key]
+        cls = CookieSerializer if self.compress else UncompressedCookieSerializer
+        return cls(keys, salt=self.salt, serializer=self.serializer,
+                   signer_kwargs={'key_derivation': self.key_derivation,
+                                  'digest_method': self.digest_method})
@@ -0,0 +1,93 @@
+import struct
+import threading
+from collections import OrderedDict
+from BJ_classes import Shoe
+from database import db, ShoeState
+
+# Shoes live on the server, the session only keeps the shoe id and position.
+# Every store keeps the card order of a shoe and hands back a fresh Shoe
+# object on load, the caller sets the position from the session.
+
+
+class MemoryShoeStore:
+    # Only shared inside one process, use the sql or redis store with several workers
+    def __init__(self, max_shoes=10000):
+        self.max_shoes = max_shoes
+        self._shoes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, shoe_id):
+        with self._lock:
+            state = self._shoes.get(shoe_id)
+            if state is None:
+                return None
+            self._shoes.move_to_end(shoe_id)
+        num_decks, penetration, cards = state
+        return Shoe(num_decks, penetration, cards=cards)
+
+    def save(self, shoe_id, shoe):
+        with self._lock:
+            self._shoes[shoe_id] = (shoe.num_decks, shoe.penetration, shoe.cards)
+            self._shoes.move_to_end(shoe_id)
+            while len(self._shoes) > self.max_shoes:
+                self._shoes.popitem(last=False)
+
+    def delete(self, shoe_id):
+        with self._lock:
+            self._shoes.pop(shoe_id, None)
+
+
+class SQLShoeStore:
+    # Uses the 'shoes' table, needs an app context like the rest of the models
+    def load(self, shoe_id):
+        state = db.session.get(ShoeState, shoe_id)
+        if state is None:
+            return None
+        return Shoe(state.num_decks, state.penetration, cards=state.cards)
+
+    def save(self, shoe_id, shoe):
+        db.session.merge(ShoeState(id=shoe_id,
+                                   num_decks=shoe.num_decks,
+                                   penetration=shoe.penetration,
+                                   cards=shoe.cards))
+        db.session.commit()
+
+    def delete(self, shoe_id):
+        ShoeState.query.filter_by(id=shoe_id).delete()
+        db.session.commit()
+
+
+class RedisShoeStore:
+    # Works with any client that has redis-py style get/set/delete
+    _header = struct.Struct('!Bd')
+
+    def __init__(self, client, prefix='shoe:', ttl=24 * 60 * 60):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def load(self, shoe_id):
+        data = self.client.get(self.prefix + shoe_id)
+        if data is None:
+            return None
+        num_decks, penetration = self._header.unpack_from(data)
+        return Shoe(num_decks, penetration, cards=data[self._header.size:])
+
+    def save(self, shoe_id, shoe):
+        data = self._header.pack(shoe.num_decks, shoe.penetration) + shoe.cards
+        self.client.set(self.prefix + shoe_id, data, ex=self.ttl)
+
+    def delete(self, shoe_id):
+        self.client.delete(self.prefix + shoe_id)
+
+
+def make_shoe_store(app):
+    kind = app.config.get('SHOE_STORE', 'memory')
+    if kind == 'memory':
+        return MemoryShoeStore()
+    if kind == 'sql':
+        return SQLShoeStore()
+    if kind == 'redis':
+        import redis
+        return RedisShoeStore(redis.Redis.from_url(app.config['REDIS_URL']))
+    raise ValueError(f"Unknown shoe store: {kind}")
@@ -0,0 +1,289 @@
+import argparse
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from BJ_classes import Shoe, Hand, RANKS, RANK_POINTS, DEALER_STANDS_ON
+
+try:
+    import numpy as np
+except ImportError:  # the pure python engine still works, only slower
+    np = None
+
+# Batch simulation of the plain hit/stand game: the dealer stands on every 17,
+# every win pays 1:1 (a natural too), a tie is a push and a player who busts
+# loses even if the dealer busts later. There is no double, split, surrender
+# or insurance; rules.simulate plays the table rules of the web app.
+
+# Cards reserved per hand in the vectorized engine, the rare hands that
+# need more draw the extra cards from the full shoe composition
+PLAYER_COLUMNS = 8
+DEALER_COLUMNS = 8
+
+STAT_KEYS = ("hands", "wins", "losses", "pushes", "player_busts",
+             "dealer_busts", "dealer_hands", "net", "net_squared")
+
+
+def _empty_stats():
+    return dict.fromkeys(STAT_KEYS, 0)
+
+
+def _merge_stats(total, part):
+    for key in STAT_KEYS:
+        total[key] += part[key]
+    return total
+
+
+# ---------- pure python engine, plays real Hand objects from a Shoe ----------
+
+def _play_python(hands, num_decks, penetration, player_stands_on, dealer_hits_soft_17, seed):
+    import random
+    # Shoe shuffles with the random module, keep the caller's random state intact
+    saved_state = random.getstate()
+    random.seed(seed)
+    try:
+        return _play_python_hands(hands, num_decks, penetration, player_stands_on,
+                                  dealer_hits_soft_17)
+    finally:
+        random.setstate(saved_state)
+
+
+def _play_python_hands(hands, num_decks, penetration, player_stands_on, dealer_hits_soft_17):
+    stats = _empty_stats()
+    shoe = Shoe(num_decks, penetration)
+    for _ in range(hands):
+        if shoe.needs_shuffle():
+            shoe.shuffle()
+        player, dealer = Hand(), Hand()
+        player.add_card(shoe.draw())
+        dealer.add_card(shoe.draw())
+        player.add_card(shoe.draw())
+        dealer.add_card(shoe.draw())
+
+        while player.get_value() < player_stands_on:
+            player.add_card(shoe.draw())
+
+        if player.is_bust():
+            net = -1
+            stats["player_busts"] += 1
+        else:
+            while _dealer_hits(dealer.get_value(), dealer.is_soft(), dealer_hits_soft_17):
+                dealer.add_card(shoe.draw())
+            stats["dealer_hands"] += 1
+            net = _settle(player.get_value(), dealer.get_value())
+            if dealer.is_bust():
+                stats["dealer_busts"] += 1
+        _count_result(stats, net)
+    return stats
+
+
+def _dealer_hits(value, soft, hits_soft_17):
+    if value < DEALER_STANDS_ON:
+        return True
+    return hits_soft_17 and soft and value == DEALER_STANDS_ON
+
+
+def _settle(player_value, dealer_value):
+    if dealer_value > 21 or player_value > dealer_value:
+        return 1
+    if player_value < dealer_value:
+        return -1
+    return 0
+
+
+def _count_result(stats, net):
+    stats["hands"] += 1
+    stats["net"] += net
+    stats["net_squared"] += net * net
+    if net > 0:
+        stats["wins"] += 1
+    elif net < 0:
+        stats["losses"] += 1
+    else:
+        stats["pushes"] += 1
+
+
+# ---------- vectorized engine ----------
+
+def _value(hard, aces):
+    return np.where((aces > 0) & (hard <= 11), hard + 10, hard)
+
+
+def _shoe_rows(rng, rows, penetration, base):
+    # Each shuffled shoe is cut into fixed slices up to the cut card, one per hand,
+    # so the cards of a hand are drawn without replacement like in the real shoe
+    columns = PLAYER_COLUMNS + DEALER_COLUMNS
+    per_shoe = max(1, int(len(base) * penetration) // columns)
+    shoes = -(-rows // per_shoe)
+    shuffled = rng.permuted(np.tile(base, (shoes, 1)), axis=1)
+    cards = shuffled[:, :per_shoe * columns].reshape(-1, columns)
+    return cards[:rows]
+
+
+def _draw(hard, aces, hit, column, rng, base):
+    # Column is None once the reserved cards ran out
+    if column is None:
+        column = base[rng.integers(0, len(base), size=len(hard))]
+    hard += np.where(hit, column, 0)
+    aces += hit & (column == 1)
+
+
+def _play_numpy_batch(rng, rows, penetration, player_stands_on, dealer_hits_soft_17, base):
+    cards = _shoe_rows(rng, rows, penetration, base).astype(np.int16)
+
+    p_hard = cards[:, 0] + cards[:, 1]
+    p_aces = (cards[:, 0] == 1).astype(np.int16) + (cards[:, 1] == 1)
+    column = 2
+    while True:
+        hit = _value(p_hard, p_aces) < player_stands_on
+        if not hit.any():
+            break
+        _draw(p_hard, p_aces, hit, cards[:, column] if column < PLAYER_COLUMNS else None, rng, base)
+        column += 1
+    player_value = _value(p_hard, p_aces)
+    player_bust = p_hard > 21
+
+    first = PLAYER_COLUMNS
+    d_hard = cards[:, first] + cards[:, first + 1]
+    d_aces = (cards[:, first] == 1).astype(np.int16) + (cards[:, first + 1] == 1)
+    column = 2
+    while True:
+        dealer_value = _value(d_hard, d_aces)
+        hit = dealer_value < DEALER_STANDS_ON
+        if dealer_hits_soft_17:
+            soft = (d_aces > 0) & (d_hard <= 11)
+            hit |= soft & (dealer_value == DEALER_STANDS_ON)
+        # the dealer does not play against a busted player
+        hit &= ~player_bust
+        if not hit.any():
+            break
+        _draw(d_hard, d_aces, hit, cards[:, first + column] if column < DEALER_COLUMNS else None, rng, base)
+        column += 1
+    dealer_bust = (d_hard > 21) & ~player_bust
+
+    net = np.where(player_bust, -1,
+                   np.where(dealer_bust | (player_value > dealer_value), 1,
+                            np.where(player_value < dealer_value, -1, 0))).astype(np.int64)
+    return {
+        "hands": rows,
+        "wins": int((net > 0).sum()),
+        "losses": int((net < 0).sum()),
+        "pushes": int((net == 0).sum()),
+        "player_busts": int(player_bust.sum()),
+        "dealer_busts": int(dealer_bust.sum()),
+        "dealer_hands": int(rows - player_bust.sum()),
+        "net": int(net.sum()),
+        "net_squared": int((net * net).sum()),
+    }
+
+
+def _play_numpy(hands, num_decks, penetration, player_stands_on, dealer_hits_soft_17, seed,
+                batch_size=250_000):
+    rng = np.random.default_rng(seed)
+    points = np.array([RANK_POINTS[rank] for rank in RANKS], dtype=np.int8)
+    base = np.repeat(points, 4 * num_decks)
+    stats = _empty_stats()
+    done = 0
+    while done < hands:
+        rows = min(batch_size, hands - done)
+        _merge_stats(stats, _play_numpy_batch(rng, rows, penetration, player_stands_on,
+                                              dealer_hits_soft_17, base))
+        done += rows
+    return stats
+
+
+def _play_chunk(args):
+    engine, *rest = args
+    if engine == "numpy":
+        return _play_numpy(*rest)
+    return _play_python(*rest)
+
+
+def simulate(hands=1_000_000, num_decks=6, penetration=0.75, player_stands_on=17,
+             dealer_hits_soft_17=False, workers=1, seed=None, engine=None):
+    if hands < 1:
+        raise ValueError("Simulate at least one hand")
+    if workers < 1:
+        raise ValueError("Simulate with at least one worker")
+    if engine is None:
+        engine = "numpy" if np is not None else "python"
+    if engine == "numpy" and np is None:
+        raise RuntimeError("The numpy engine needs numpy installed")
+
+    # Independent seeds for every worker so they never replay the same cards
+    if np is not None:
+        seeds = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(workers)]
+    else:
+        import random
+        master = random.Random(seed)
+        seeds = [master.getrandbits(32) for _ in range(workers)]
+    chunks = [hands // workers + (1 if i < hands % workers else 0) for i in range(workers)]
+    jobs = [(engine, n, num_decks, penetration, player_stands_on, dealer_hits_soft_17, s)
+            for n, s in zip(chunks, seeds) if n]
+
+    start = time.perf_counter()
+    if workers == 1:
+        parts = [_play_chunk(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_play_chunk, jobs))
+    elapsed = time.perf_counter() - start
+
+    stats = _empty_stats()
+    for part in parts:
+        _merge_stats(stats, part)
+    return summarize(stats, elapsed)
+
+
+def summarize(stats, elapsed):
+    hands = stats["hands"]
+    ev = stats["net"] / hands
+    variance = stats["net_squared"] / hands - ev * ev
+    dealer_hands = stats["dealer_hands"]
+    return {
+        "hands": hands,
+        "ev": ev,
+        "house_edge": -ev,
+        "std_dev": variance ** 0.5,
+        "win_rate": stats["wins"] / hands,
+        "loss_rate": stats["losses"] / hands,
+        "push_rate": stats["pushes"] / hands,
+        "player_bust_rate": stats["player_busts"] / hands,
+        "dealer_bust_rate": stats["dealer_busts"] / dealer_hands if dealer_hands else 0.0,
+        "seconds": elapsed,
+        "hands_per_second": hands / elapsed if elapsed else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate blackjack hands with the table rules")
+    parser.add_argument("--hands", type=int, default=1_000_000)
+    parser.add_argument("--decks", type=int, default=6)
+    parser.add_argument("--penetration", type=float, default=0.75)
+    parser.add_argument("--stand-on", type=int, default=17, help="player hits below this value")
+    parser.add_argument("--h17", action="store_true", help="dealer hits soft 17")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--engine", choices=["numpy", "python"])
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+    if args.hands < 1:
+        parser.error("--hands must be at least 1")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    report = simulate(args.hands, args.decks, args.penetration, args.stand_on,
+                      args.h17, args.workers, args.seed, args.engine)
+    if args.json:
+        print(json.dumps(report))
+        return
+    print(f"Hands played:     {report['hands']}")
+    print(f"EV per hand:      {report['ev']:+.4f} (std dev {report['std_dev']:.4f})")
+    print(f"House edge:       {report['house_edge'] * 100:.2f}%")
+    print(f"Win/loss/push:    {report['win_rate']:.4f} / {report['loss_rate']:.4f} / {report['push_rate']:.4f}")
+    print(f"Player busts:     {report['player_bust_rate']:.4f}")
+    print(f"Dealer busts:     {report['dealer_bust_rate']:.4f}")
+    print(f"Speed:            {report['hands_per_second']:,.0f} hands/sec")
+
+
+if __name__ == "__main__":
+    main()
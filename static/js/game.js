@@ -0,0 +1,66 @@
+function showHint() {
+    fetch(document.body.dataset.hint)
+        .then(response => response.json())
+        .then(data => {
+            const ev = ['hit', 'stand'].includes(data.action) ? ` (EV ${data.ev.toFixed(3)})` : '';
+            document.getElementById('hint').textContent = data.error || `Best move: ${data.action}${ev}`;
+        });
+}
+
+function renderCards(container, cards) {
+    container.replaceChildren(...cards.map(card => {
+        const div = document.createElement('div');
+        if (card === null) {
+            div.className = 'card back';
+        } else {
+            const red = card.suit === 'Hearts' || card.suit === 'Diamonds';
+            div.className = 'card ' + (red ? 'red' : 'black');
+            div.append(card.rank, document.createElement('br'), card.suit);
+        }
+        return div;
+    }));
+}
+
+function renderHands(container, state) {
+    const several = state.hands.length > 1;
+    container.replaceChildren(...state.hands.map((hand, index) => {
+        const box = document.createElement('div');
+        box.className = 'hand-container' + (several && index === state.active ? ' active' : '');
+        const title = document.createElement('h2');
+        title.textContent = `${container.dataset.username}'s Hand` + (several ? ` ${index + 1}` : '');
+        const cards = document.createElement('div');
+        cards.className = 'cards';
+        renderCards(cards, hand.cards);
+        const score = document.createElement('p');
+        score.textContent = `Score: ${hand.score}` + (several ? ` \u00b7 Bet: $${hand.bet}` : '');
+        box.append(title, cards, score);
+        return box;
+    }));
+}
+
+function renderState(state) {
+    renderCards(document.getElementById('dealer-cards'), state.dealer_hand);
+    renderHands(document.getElementById('player-hands'), state);
+    document.querySelectorAll('[data-action]').forEach(form => {
+        form.hidden = !state.actions.includes(form.dataset.action);
+    });
+    document.getElementById('pot').textContent = `$${state.bet}`;
+    document.getElementById('dealer-score').textContent = `Score: ${state.dealer_score}`;
+    document.getElementById('dealer-score').hidden = !state.game_over;
+    document.getElementById('money').textContent = `$${state.money}`;
+    document.getElementById('result').textContent = state.result || '';
+    document.getElementById('result-box').hidden = !state.game_over;
+    document.getElementById('actions').hidden = state.game_over;
+    document.getElementById('hint').textContent = '';
+}
+
+// Every move answers with the new state, without the script the forms still post as pages
+document.querySelectorAll('[data-api]').forEach(button => {
+    button.addEventListener('click', event => {
+        event.preventDefault();
+        fetch(button.dataset.api, {method: 'POST'})
+            .then(response => response.ok ? response.json() : Promise.reject(response))
+            .then(renderState)
+            .catch(() => { button.form.submit(); });
+    });
+});
@@ -0,0 +1,153 @@
+import json
+from functools import lru_cache
+from BJ_classes import RANK_POINTS, DEALER_STANDS_ON, decode_card
+
+# Hit/stand advice against a dealer who stands on every 17 and does not peek,
+# the hint route takes double, split and surrender from rules.basic_strategy.
+# A composition is a tuple of 10 card counts, index 0 is the aces and index 9
+# every ten valued card. The dealer outcomes take card removal into account,
+# the player EV uses the composition as it is when the advice is asked.
+
+DEALER_RESULTS = (17, 18, 19, 20, 21, "bust")
+
+_CODE_POINTS = [RANK_POINTS[decode_card(code)[0]] for code in range(52)]
+
+
+def shoe_composition(codes):
+    counts = [0] * 10
+    for code in codes:
+        counts[_CODE_POINTS[code] - 1] += 1
+    return tuple(counts)
+
+
+def full_composition(num_decks):
+    return (4 * num_decks,) * 9 + (16 * num_decks,)
+
+
+def _value(hard, soft):
+    return hard + 10 if soft and hard <= 11 else hard
+
+
+def dealer_distribution(upcard, composition):
+    # Probability of each final dealer total, upcard is 1 (ace) .. 10
+    memo = {}
+
+    def play(comp, hard, has_ace):
+        key = (comp, hard, has_ace)
+        if key in memo:
+            return memo[key]
+        value = _value(hard, has_ace)
+        if hard > 21:
+            result = (0.0,) * 5 + (1.0,)
+        elif value >= DEALER_STANDS_ON:
+            result = tuple(1.0 if total == value else 0.0 for total in DEALER_RESULTS)
+        else:
+            total_cards = sum(comp)
+            result = [0.0] * 6
+            for index, count in enumerate(comp):
+                if not count:
+                    continue
+                chance = count / total_cards
+                rest = comp[:index] + (count - 1,) + comp[index + 1:]
+                outcome = play(rest, hard + index + 1, has_ace or index == 0)
+                for i in range(6):
+                    result[i] += chance * outcome[i]
+            result = tuple(result)
+        memo[key] = result
+        return result
+
+    return dict(zip(DEALER_RESULTS, play(tuple(composition), upcard, upcard == 1)))
+
+
+def stand_ev(value, dealer):
+    if value > 21:
+        return -1.0
+    win = dealer["bust"]
+    lose = 0.0
+    for total in DEALER_RESULTS[:-1]:
+        if value > total:
+            win += dealer[total]
+        elif value < total:
+            lose += dealer[total]
+    return win - lose
+
+
+def _player_table(upcard, composition):
+    dealer = dealer_distribution(upcard, composition)
+    total_cards = sum(composition)
+    chances = [(index + 1, count / total_cards) for index, count in enumerate(composition) if count]
+    best = {}
+
+    def play(hard, soft):
+        if hard > 21:
+            return -1.0, -1.0, -1.0
+        key = (hard, soft)
+        if key not in best:
+            standing = stand_ev(_value(hard, soft), dealer)
+            hitting = 0.0
+            for points, chance in chances:
+                hitting += chance * play(hard + points, soft or points == 1)[0]
+            best[key] = (max(standing, hitting), standing, hitting)
+        return best[key]
+
+    rows = {}
+    for hard in range(2, 22):
+        for soft in (False, True):
+            if soft and hard > 11:
+                continue
+            ev, standing, hitting = play(hard, soft)
+            value = _value(hard, soft)
+            rows[(value, soft, upcard)] = (
+                "hit" if hitting > standing else "stand", ev, standing, hitting)
+    return rows
+
+
+@lru_cache(maxsize=128)
+def build_table(composition):
+    # One table per remaining shoe composition, advice is then a dict lookup.
+    # Every upcard gets its rows, the composition of a shoe in play leaves the
+    # upcard out and that may have been the last card of its rank
+    table = {}
+    for upcard in range(1, 11):
+        table.update(_player_table(upcard, composition))
+    return table
+
+
+def advise(table, value, soft, upcard):
+    action, ev, standing, hitting = table[(value, soft, upcard)]
+    return {"action": action, "ev": ev, "stand_ev": standing, "hit_ev": hitting}
+
+
+def save_table(table, path):
+    rows = [[value, soft, upcard, *advice] for (value, soft, upcard), advice in table.items()]
+    with open(path, "w") as f:
+        json.dump(rows, f)
+
+
+def load_table(path):
+    with open(path) as f:
+        rows = json.load(f)
+    return {(value, soft, upcard): tuple(advice) for value, soft, upcard, *advice in rows}
+
+
+def get_table(num_decks, path=None):
+    # A saved table skips the build, otherwise it is built for a full shoe
+    if path:
+        try:
+            return load_table(path)
+        except FileNotFoundError:
+            pass
+    table = build_table(full_composition(num_decks))
+    if path:
+        save_table(table, path)
+    return table
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Build the hit/stand table for a full shoe")
+    parser.add_argument("--decks", type=int, default=6)
+    parser.add_argument("--out", default="strategy_table.json")
+    args = parser.parse_args()
+    save_table(build_table(full_composition(args.decks)), args.out)
+    print(f"Saved {args.out}")
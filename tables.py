@@ -0,0 +1,336 @@
+import threading
+import time
+import uuid
+from BJ_classes import Shoe, Hand, Dealer, Player, DEALER_STANDS_ON
+
+# Shared tables: up to 7 seats dealt from one shoe with one dealer.
+# Every table has its own lock, actions on one table run one at a time and
+# bump the table version; event streams wait on the table's condition and
+# push the new state when the version changes. An open stream keeps its
+# worker thread for as long as the page is open. Money is not touched here,
+# the routes take the bets and settle the rounds this module hands back.
+# A seat that lets its turn run out stands, tables left empty or idle are
+# dropped by the manager and the bets still on them are settled.
+
+MAX_SEATS = 7
+# an empty table is kept this long for its creator to sit down
+EMPTY_SECONDS = 60
+
+
+class Seat:
+    def __init__(self, user_id, username):
+        self.user_id = user_id
+        self.username = username
+        self.player = Player(balance=0)
+        self.round_key = None
+        self.result = None
+        self.left = False
+
+
+class Table:
+    def __init__(self, num_decks=6, penetration=0.75, owner=None, turn_seconds=30):
+        self.id = uuid.uuid4().hex[:8]
+        self.owner = owner
+        self.shoe = Shoe(num_decks, penetration)
+        self.dealer = Dealer(self.shoe)
+        self.seats = [None] * MAX_SEATS
+        self.phase = 'betting'
+        self.turn = None
+        self.turn_seconds = turn_seconds
+        self.turn_deadline = None
+        self.version = 0
+        self.last_change = time.monotonic()
+        self.closed = False
+        self.changed = threading.Condition()
+
+    def _seat_of(self, user_id):
+        for index, seat in enumerate(self.seats):
+            if seat is not None and seat.user_id == user_id and not seat.left:
+                return index
+        return None
+
+    def _touch(self):
+        self.version += 1
+        self.last_change = time.monotonic()
+        self.changed.notify_all()
+
+    def expire_turn(self):
+        # The seat in turn stands once its time is up, checked before the table is read or played
+        with self.changed:
+            if self.turn_deadline is None or time.monotonic() < self.turn_deadline:
+                return []
+            settlements = self._next_turn()
+            self._touch()
+            return settlements
+
+    def seconds_left(self):
+        # Until the seat in turn runs out of time, None when nobody is playing
+        with self.changed:
+            if self.turn_deadline is None:
+                return None
+            return max(self.turn_deadline - time.monotonic(), 0.0)
+
+    def close(self):
+        # The hands in play stand and the bets not dealt yet come back
+        with self.changed:
+            settlements = []
+            if self.phase == 'playing':
+                for seat in self._playing():
+                    seat.left = True
+                settlements = self._next_turn()
+            elif self.phase == 'betting':
+                settlements = [(s.user_id, s.round_key, s.player.current_bet, 'push', s.player.current_bet)
+                               for s in self._playing()]
+            self.seats = [None] * MAX_SEATS
+            self.closed = True
+            self._touch()
+            return settlements
+
+    def is_empty(self):
+        return all(seat is None for seat in self.seats)
+
+    def join(self, user_id, username):
+        with self.changed:
+            index = self._seat_of(user_id)
+            if index is not None:
+                return index
+            for index, seat in enumerate(self.seats):
+                if seat is None:
+                    self.seats[index] = Seat(user_id, username)
+                    self._touch()
+                    return index
+            return None
+
+    # Actions answer with an error message (or None) and the rounds to settle
+    def leave(self, user_id):
+        # A hand in play stays on the table and stands, its bet is still settled.
+        # A bet placed for a round not dealt yet is handed back as a push
+        with self.changed:
+            index = self._seat_of(user_id)
+            if index is None:
+                return None, []
+            seat = self.seats[index]
+            bet = seat.player.current_bet
+            if self.phase == 'playing' and bet:
+                seat.left = True
+                settlements = self._next_turn() if self.turn == index else []
+            else:
+                self.seats[index] = None
+                settlements = []
+                if self.phase == 'betting' and bet:
+                    settlements = [(seat.user_id, seat.round_key, bet, 'push', bet)]
+            self._touch()
+            return None, settlements
+    def place_bet(self, user_id, amount, round_key):
+        # The money is taken before the table is locked, a bet refused here is
+        # handed back by the caller
+        with self.changed:
+            index = self._seat_of(user_id)
+            if index is None:
+                return "Take a seat first", []
+            if self.phase == 'playing':
+                return "Wait for the next round", []
+            if self.phase == 'finished':
+                self._next_round()
+            seat = self.seats[index]
+            if seat.player.current_bet:
+                return "Bet already placed", []
+            seat.player.current_bet = amount
+            seat.round_key = round_key
+            settlements = []
+            # the round starts once everybody at the table has bet
+            if all(s.player.current_bet for s in self.seats if s is not None):
+                settlements = self._deal()
+            self._touch()
+            return None, settlements
+
+    def deal(self, user_id):
+        with self.changed:
+            index = self._seat_of(user_id)
+            if index is None or self.phase != 'betting' or not self.seats[index].player.current_bet:
+                return "Place a bet first", []
+            settlements = self._deal()
+            self._touch()
+            return None, settlements
+
+    def hit(self, user_id):
+        with self.changed:
+            index = self._seat_of(user_id)
+            if index is None or index != self.turn:
+                return "Not your turn", []
+            hand = self.seats[index].player.hand
+            self.seats[index].player.receive_card(self.shoe.draw())
+            settlements = []
+            if hand.get_value() >= 21:
+                settlements = self._next_turn()
+            self._touch()
+            return None, settlements
+
+    def stand(self, user_id):
+        with self.changed:
+            index = self._seat_of(user_id)
+            if index is None or index != self.turn:
+                return "Not your turn", []
+            settlements = self._next_turn()
+            self._touch()
+            return None, settlements
+
+    def _next_round(self):
+        for index, seat in enumerate(self.seats):
+            if seat is None:
+                continue
+            if seat.left:
+                self.seats[index] = None
+                continue
+            seat.player.hand = Hand()
+            seat.player.current_bet = 0
+            seat.round_key = None
+            seat.result = None
+        self.dealer.hand = Hand()
+        self.phase = 'betting'
+
+    def _deal(self):
+        if self.shoe.needs_shuffle():
+            self.shoe.shuffle()
+        self.dealer.hand = Hand()
+        for _ in range(2):
+            for seat in self._playing():
+                seat.player.receive_card(self.shoe.draw())
+            # the dealer's first card is the hole card
+            self.dealer.deal_card(visible=len(self.dealer.hand) > 0)
+        self.phase = 'playing'
+        self.turn = -1
+        return self._next_turn()
+
+    def _next_turn(self):
+        # Seats play in order, a seat with 21 or that left stands on its own
+        start = -1 if self.turn is None else self.turn
+        for index in range(start + 1, MAX_SEATS):
+            seat = self.seats[index]
+            if seat is None or not seat.player.current_bet:
+                continue
+            if seat.left or seat.player.hand.get_value() >= 21:
+                continue
+            self.turn = index
+            self.turn_deadline = time.monotonic() + self.turn_seconds
+            return []
+        self.turn = None
+        self.turn_deadline = None
+        return self._finish()
+
+    def _finish(self):
+        hand = self.dealer.hand
+        self.dealer.reveal()
+        if any(not s.player.hand.is_bust() for s in self._playing()):
+            while hand.get_value() < DEALER_STANDS_ON:
+                self.dealer.deal_card()
+        dealer_score = hand.get_value()
+
+        settlements = []
+        for seat in self._playing():
+            player_score = seat.player.hand.get_value()
+            bet = seat.player.current_bet
+            if player_score > 21:
+                outcome, payout = 'loss', 0
+            elif dealer_score > 21 or player_score > dealer_score:
+                outcome, payout = 'win', bet * 2
+            elif player_score < dealer_score:
+                outcome, payout = 'loss', 0
+            else:
+                outcome, payout = 'push', bet
+            seat.result = outcome
+            settlements.append((seat.user_id, seat.round_key, bet, outcome, payout))
+        self.phase = 'finished'
+        return settlements
+
+    def _playing(self):
+        return [s for s in self.seats if s is not None and s.player.current_bet]
+
+    def state(self, user_id=None):
+        with self.changed:
+            return self._state(user_id)
+
+    def _state(self, user_id):
+        reveal = self.phase == 'finished'
+        dealer_cards = [_card(card) if card.visible or reveal else None
+                        for card in self.dealer.hand.hand]
+        seats = []
+        for index, seat in enumerate(self.seats):
+            if seat is None:
+                seats.append(None)
+                continue
+            seats.append({
+                'seat': index,
+                'username': seat.username,
+                'you': seat.user_id == user_id,
+                'bet': seat.player.current_bet,
+                'hand': [_card(card) for card in seat.player.hand.hand],
+                'score': seat.player.hand.get_value(),
+                'result': seat.result,
+                'left': seat.left,
+            })
+        return {
+            'id': self.id,
+            'version': self.version,
+            'phase': self.phase,
+            'turn': self.turn,
+            'turn_seconds_left': (None if self.turn_deadline is None
+                                  else round(max(self.turn_deadline - time.monotonic(), 0.0), 1)),
+            'dealer_hand': dealer_cards,
+            'dealer_score': self.dealer.hand.get_value() if reveal else None,
+            'seats': seats,
+        }
+
+    def wait_for_change(self, version, timeout):
+        # Blocks an event stream until the table moves past the version it has seen
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+
+def _card(card):
+    return {'rank': card.rank, 'suit': card.suit}
+
+
+class TableManager:
+    def __init__(self, num_decks=6, penetration=0.75, turn_seconds=30, idle_seconds=1800,
+                 tables_per_user=2):
+        self.num_decks = num_decks
+        self.penetration = penetration
+        self.turn_seconds = turn_seconds
+        self.idle_seconds = idle_seconds
+        self.tables_per_user = tables_per_user
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def create(self, owner):
+        # None once the owner has tables_per_user open tables
+        with self._lock:
+            if sum(1 for t in self._tables.values() if t.owner == owner) >= self.tables_per_user:
+                return None
+            table = Table(self.num_decks, self.penetration, owner, self.turn_seconds)
+            self._tables[table.id] = table
+        return table
+
+    def prune(self):
+        # Drops empty and idle tables, answers with the rounds of their bets to settle
+        now = time.monotonic()
+        with self._lock:
+            stale = [t for t in self._tables.values()
+                     if now - t.last_change > (EMPTY_SECONDS if t.is_empty() else self.idle_seconds)]
+            for table in stale:
+                del self._tables[table.id]
+        settlements = []
+        for table in stale:
+            settlements += table.close()
+        return settlements
+
+    def get(self, table_id):
+        with self._lock:
+            return self._tables.get(table_id)
+
+    def list(self):
+        with self._lock:
+            tables = list(self._tables.values())
+        return [{'id': t.id, 'phase': t.phase,
+                 'players': sum(1 for s in t.seats if s is not None)} for t in tables]
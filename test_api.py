@@ -0,0 +1,62 @@
+import asyncio
+import pytest
+
+
+def test_api_needs_login(client):
+    assert client.post('/api/v1/hit').status_code == 401
+
+
+def test_api_round(player):
+    # a natural settles the round at once, deal again until there is a hand to play
+    money = 1000
+    while True:
+        state = player.post('/api/v1/deal', json={'bet_amount': 50}).get_json()
+        money -= 50
+        if not state['game_over']:
+            break
+        money = state['money']
+
+    assert len(state['player_hand']) == 2
+    assert state['dealer_hand'][0] is None
+    assert state['dealer_score'] is None
+    assert state['money'] == money
+    if 'no_insurance' in state['actions']:
+        state = player.post('/api/v1/no_insurance').get_json()
+
+    while not state['game_over'] and state['player_score'] < 17:
+        state = player.post('/api/v1/hit').get_json()
+    if not state['game_over']:
+        state = player.post('/api/v1/stand').get_json()
+
+    assert state['game_over']
+    assert state['result']
+    assert None not in state['dealer_hand']
+    assert player.post('/api/v1/stand').status_code == 409
+    assert player.get('/api/v1/state').get_json() == state
+
+
+def test_api_rejects_bad_bets(player):
+    assert player.post('/api/v1/deal', json={'bet_amount': 'lots'}).status_code == 400
+    assert player.post('/api/v1/deal', json={'bet_amount': 5000}).get_json()['error']
+
+
+def test_asgi_app_answers(app):
+    pytest.importorskip('asgiref')
+    from asgi import asgi_app
+
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+             'scheme': 'http', 'path': '/login', 'raw_path': b'/login', 'root_path': '',
+             'query_string': b'', 'headers': [(b'host', b'localhost')],
+             'client': ('127.0.0.1', 1234), 'server': ('localhost', 80)}
+    asyncio.run(asgi_app(scope, receive, send))
+
+    assert messages[0]['status'] == 200
+    assert b'<form' in b''.join(m.get('body', b'') for m in messages[1:])
@@ -0,0 +1,43 @@
+import re
+from jinja2 import FileSystemBytecodeCache
+from assets import cards_html, ONE_YEAR
+
+
+def test_templates_use_bytecode_cache(app):
+    assert isinstance(app.jinja_env.bytecode_cache, FileSystemBytecodeCache)
+
+
+def test_cards_markup():
+    cards = [{'rank': 'Ace', 'suit': 'Hearts'}, {'rank': '7', 'suit': 'Clubs'}]
+
+    assert cards_html(cards) == ('<div class="card red">Ace<br>Hearts</div>\n'
+                                 '<div class="card black">7<br>Clubs</div>')
+    assert cards_html(cards, hide_first=True).startswith('<div class="card back"></div>\n')
+
+
+def test_fingerprinted_assets_are_cached(player):
+    player.post('/deal', data={'bet_amount': '5'})
+    html = player.get('/game').get_data(as_text=True)
+    url = re.search(r'href="(/static/css/game\.css\?v=\w+)"', html).group(1)
+
+    cached = player.get(url)
+    assert cached.status_code == 200
+    assert cached.cache_control.max_age == ONE_YEAR
+    assert cached.cache_control.immutable
+    assert not player.get('/static/css/game.css?v=old').cache_control.max_age
+
+
+def test_game_page_not_modified(player):
+    while 'stand' not in player.post('/api/v1/deal', json={'bet_amount': 5}).get_json()['actions']:
+        pass
+    first = player.get('/game')
+    etag = first.headers['ETag']
+
+    again = player.get('/game', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.data == b''
+
+    player.post('/stand')
+    changed = player.get('/game', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
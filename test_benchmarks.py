@@ -0,0 +1,66 @@
+import importlib.util
+import pytest
+from BJ_classes import Deck, Hand, Card
+
+# Run with pytest-benchmark installed, e.g.
+#   pytest test_benchmarks.py --benchmark-autosave
+#   pytest test_benchmarks.py --benchmark-compare --benchmark-compare-fail=min:25%
+needs_benchmark = pytest.mark.skipif(importlib.util.find_spec("pytest_benchmark") is None,
+                                     reason="pytest-benchmark is not installed")
+
+
+@pytest.fixture
+def hand():
+    hand = Hand()
+    for rank, suit in (('Ace', 'Spades'), ('7', 'Hearts'), ('King', 'Clubs')):
+        hand.add_card(Card(rank, suit))
+    return hand
+
+
+@needs_benchmark
+def test_deck_draw(benchmark):
+    def draw_deck():
+        deck = Deck()
+        for _ in range(52):
+            deck.draw()
+    benchmark(draw_deck)
+
+
+@needs_benchmark
+def test_hand_get_value(benchmark, hand):
+    assert benchmark(hand.get_value) == 18
+
+
+@needs_benchmark
+def test_pack_round(benchmark):
+    import rules
+    from BJ_classes import Shoe
+    cards = Shoe(6).cards
+    state = rules.deal(rules.Rules(), cards, 0, 10)
+    data = benchmark(rules.pack, state)
+    assert rules.unpack(data, cards, state.pos) == state
+
+
+@needs_benchmark
+def test_unpack_round(benchmark):
+    import rules
+    from BJ_classes import Shoe
+    cards = Shoe(6).cards
+    state = rules.deal(rules.Rules(), cards, 0, 10)
+    assert benchmark(rules.unpack, rules.pack(state), cards, state.pos) == state
+
+
+@needs_benchmark
+def test_play_round(benchmark):
+    import rules
+    from BJ_classes import Shoe
+    cards = Shoe(6).cards
+    state = benchmark(rules.play_round, rules.Rules(), cards, 0, 10)
+    assert state.phase == rules.DONE
+
+
+def test_benchmark_harness_runs(app):
+    import benchmark
+    report = benchmark.run_app_benchmark(rounds=3)
+    assert report['deal']['requests'] == 3
+    assert report['game']['queries'] >= 1
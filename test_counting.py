@@ -0,0 +1,81 @@
+import json
+import random
+from BJ_classes import Shoe, Deck
+from counting import SYSTEMS, CountTracker, bet_spread, main
+from database import db, GameRound
+
+
+def test_balanced_systems_sum_to_zero():
+    for name, tags in SYSTEMS.items():
+        assert sum(tags) == (4 if name == 'ko' else 0), name
+
+
+def test_tracker_follows_the_shoe():
+    shoe = Shoe(2)
+    shoe.tracker = CountTracker('hi-lo', 2)
+    for _ in range(40):
+        shoe.draw()
+
+    rescanned = sum(SYSTEMS['hi-lo'][code] for code in shoe.cards[:40])
+    assert shoe.tracker.running == rescanned
+    assert shoe.tracker.seen == 40
+    assert shoe.tracker.remaining_decks() == 64 / 52
+    assert shoe.tracker.true_count() == rescanned / (64 / 52)
+    assert shoe.tracker.penetration() == 40 / 104
+
+    shoe.shuffle()
+    assert (shoe.tracker.running, shoe.tracker.seen) == (0, 0)
+
+
+def test_tracker_on_deck():
+    deck = Deck()
+    deck.tracker = CountTracker('zen', 1)
+    while deck.look_deck():
+        deck.draw()
+
+    assert deck.tracker.running == 0
+    assert deck.tracker.true_count() == 0
+
+
+def test_bet_spread_flags_count_following_bets():
+    rng = random.Random(3)
+    rounds = []
+    for _ in range(200):
+        count = rng.uniform(-4, 6)
+        rounds.append(('counter', 10 if count < 1 else 25 * int(count), count))
+        rounds.append(('flat', 10, count))
+        rounds.append(('random', rng.choice((10, 50)), count))
+
+    report = {row['player']: row for row in bet_spread(rounds)}
+
+    assert report['counter']['flagged']
+    assert not report['flat']['flagged']
+    assert not report['random']['flagged']
+
+
+def test_rounds_record_the_true_count(player, capsys):
+    for _ in range(5):
+        state = player.post('/api/v1/deal', json={'bet_amount': 1}).get_json()
+        if not state['game_over']:
+            player.post('/api/v1/stand')
+
+    rounds = db.session.execute(db.select(GameRound)).scalars().all()
+    assert len(rounds) == 5
+    assert all(r.true_count is not None for r in rounds)
+
+    # a flat bettor is never flagged
+    assert main(['analyze', '--json', '--min-rounds', '1']) == 0
+    assert json.loads(capsys.readouterr().out) == []
+
+
+def test_lost_shoe_starts_a_new_count(app, player):
+    with player.session_transaction() as sess:
+        sess['shoe_id'] = 'f' * 32
+        sess['shoe_pos'] = 100
+        sess['running_count'] = 40
+    player.post('/deal', data={'bet_amount': '10'})
+
+    with player.session_transaction() as sess:
+        shoe = app.extensions['shoe_store'].load(sess['shoe_id'])
+        dealt = shoe.cards[:sess['shoe_pos']]
+        assert sess['running_count'] == sum(SYSTEMS['hi-lo'][code] for code in dealt)
@@ -0,0 +1,149 @@
+import logging
+import threading
+import pytest
+from flask import Flask
+from sqlalchemy.orm import Session
+from database import (db, User, GameRound, take_bet, settle_round, utcnow, engine_options,
+                      configure_database, check_database, read_user)
+
+
+@pytest.fixture
+def file_app(tmp_path):
+    # A real file so every thread gets its own connection
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'stress.db'}"
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(username='racer', password_hash='x', money=1000))
+        db.session.commit()
+    return app
+
+
+def run_threads(app, worker, threads=8):
+    def target(n):
+        with app.app_context():
+            worker(n)
+            db.session.remove()
+    pool = [threading.Thread(target=target, args=(n,)) for n in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+
+def test_concurrent_bets_never_lose_updates(file_app):
+    accepted = []
+
+    def worker(n):
+        for i in range(40):
+            if take_bet(1, 10):
+                accepted.append(1)
+                # every other accepted bet is won back double
+                if i % 2:
+                    settle_round(1, f"{n}-{i}", 10, 'win', 20, utcnow())
+
+    run_threads(file_app, worker)
+    with file_app.app_context():
+        user = db.session.get(User, 1)
+        rounds = GameRound.query.count()
+        assert user.money >= 0
+        assert user.money == 1000 - 10 * len(accepted) + 20 * rounds
+        assert user.wins == rounds
+
+
+def test_round_is_settled_only_once(file_app):
+    results = []
+
+    def worker(n):
+        results.append(settle_round(1, 'same-round', 10, 'win', 20, utcnow()))
+
+    run_threads(file_app, worker)
+    with file_app.app_context():
+        assert results.count(True) == 1
+        assert db.session.get(User, 1).money == 1020
+        assert GameRound.query.count() == 1
+
+
+def test_rounds_recorded_by_routes(player, app):
+    player.post('/deal', data={'bet_amount': '100'})
+    # an ace up asks for insurance first, without it the click is ignored
+    player.post('/no_insurance')
+    # a link cannot make a move
+    assert player.get('/double').status_code == 405
+    assert player.get('/stand').status_code == 405
+    player.post('/stand')
+    player.post('/stand')
+
+    rounds = GameRound.query.all()
+    user = User.query.filter_by(username='player').one()
+    assert len(rounds) == 1
+    assert rounds[0].bet == 100
+    assert user.money == 900 + rounds[0].payout
+    assert user.wins + user.losses == (0 if rounds[0].outcome == 'push' else 1)
+
+
+def test_bet_must_be_affordable(player, app):
+    assert player.post('/deal', data={'bet_amount': '5000'}).data == b"You don't have enough money"
+    assert player.post('/deal', data={'bet_amount': '-5'}).data == b"Invalid bet"
+    assert User.query.filter_by(username='player').one().money == 1000
+
+
+def test_engine_options_for_postgres():
+    env = {'DB_POOL_SIZE': '20', 'DB_MAX_OVERFLOW': '5', 'DB_POOL_RECYCLE': '600',
+           'DB_STATEMENT_TIMEOUT_MS': '2500'}
+    options = engine_options('postgresql://bj@localhost/bj', env)
+
+    assert options['pool_size'] == 20
+    assert options['max_overflow'] == 5
+    assert options['pool_recycle'] == 600
+    assert options['pool_pre_ping'] is True
+    assert options['connect_args'] == {'options': '-c statement_timeout=2500'}
+
+
+def test_engine_options_for_sqlite_skip_pool_sizes():
+    options = engine_options('sqlite:///game.db', {'DB_STATEMENT_TIMEOUT_MS': '2500'})
+
+    assert 'pool_size' not in options
+    assert 'connect_args' not in options
+
+
+@pytest.fixture
+def replica_bind():
+    yield
+    # the bind's metadata is kept on the shared db object, other apps have no replica
+    db.metadatas.pop('replica', None)
+
+
+def test_reads_go_to_the_replica(tmp_path, caplog, replica_bind):
+    env = {'DATABASE_REPLICA_URL': f"sqlite:///{tmp_path / 'replica.db'}", 'DB_POOL_SIZE': '3'}
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'primary.db'}"
+    configure_database(app, env)
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        with Session(db.engines['replica']) as replica:
+            User.metadata.create_all(replica.get_bind())
+            replica.add(User(username='copied', password_hash='x', money=42))
+            replica.commit()
+
+        assert db.session.get(User, 1) is None
+        assert read_user(1).money == 42
+
+    with caplog.at_level(logging.INFO, logger='database'):
+        check_database(app)
+    assert 'Database replica' in caplog.text
+
+
+def test_refused_deal_does_not_forfeit_the_round(player, app):
+    state = player.post('/api/v1/deal', json={'bet_amount': 100}).get_json()
+    while state['game_over']:
+        state = player.post('/api/v1/deal', json={'bet_amount': 100}).get_json()
+    rounds = GameRound.query.count()
+
+    assert player.post('/deal', data={'bet_amount': str(10**9)}).get_data(as_text=True) \
+        == "You don't have enough money"
+    assert GameRound.query.count() == rounds
+    assert player.get('/api/v1/state').get_json()['game_over'] is False
@@ -0,0 +1,67 @@
+import pstats
+from flask import Flask, g, render_template_string, session
+from sqlalchemy import create_engine, text
+from database import db, User
+from instrumentation import init_instrumentation
+
+
+def make_app(tmp_path, sample_rate=0.0):
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['INSTRUMENTATION'] = True
+    app.config['PROFILE_SAMPLE_RATE'] = sample_rate
+    app.config['PROFILE_DIR'] = str(tmp_path)
+    db.init_app(app)
+    init_instrumentation(app)
+
+    @app.route('/play')
+    def play():
+        db.session.execute(db.select(User)).all()
+        session['hand'] = ['Ace', 'King']
+        return render_template_string("{{ hand|join(',') }}", hand=session['hand'])
+
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def metric(text, name, route):
+    prefix = f'{name}{{route="{route}"}} '
+    return float(next(line[len(prefix):] for line in text.splitlines() if line.startswith(prefix)))
+
+
+def test_metrics_per_route(tmp_path):
+    client = make_app(tmp_path).test_client()
+    client.get('/play')
+    client.get('/play')
+    text = client.get('/metrics').get_data(as_text=True)
+
+    assert metric(text, 'bj_request_seconds_count', 'play') == 2
+    assert metric(text, 'bj_sql_queries_sum', 'play') == 2
+    assert metric(text, 'bj_render_seconds_sum', 'play') > 0
+    assert metric(text, 'bj_session_bytes_sum', 'play') > 0
+    assert metric(text, 'bj_request_seconds_sum', 'play') >= metric(text, 'bj_sql_seconds_sum', 'play')
+
+
+def test_sampled_profiles_are_merged_per_route(tmp_path):
+    client = make_app(tmp_path, sample_rate=1.0).test_client()
+    client.get('/play')
+    client.get('/play')
+
+    assert [p.name for p in tmp_path.glob('*.prof')] == ['play.prof']
+    stats = pstats.Stats(str(tmp_path / 'play.prof'))
+    assert stats.total_calls > 0
+
+
+def test_only_the_apps_engines_are_timed(tmp_path):
+    app = make_app(tmp_path)
+    other = create_engine('sqlite://')
+    with app.test_request_context():
+        with other.connect() as conn:
+            conn.execute(text('SELECT 1'))
+        assert g._metrics['sql_queries'] == 0
+
+
+def test_disabled_by_default(client):
+    assert client.get('/metrics').status_code == 404
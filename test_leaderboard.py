@@ -0,0 +1,88 @@
+import pytest
+import leaderboard
+from sqlalchemy import event
+from database import db, User
+
+
+@pytest.fixture
+def players(app):
+    leaderboard.invalidate()
+    for n in range(25):
+        db.session.add(User(username=f"p{n}", password_hash='x',
+                            money=1000 + (n % 5) * 100, wins=n, losses=24 - n))
+    db.session.commit()
+    yield
+    leaderboard.invalidate()
+
+
+def test_keyset_pages_cover_every_player(players, player):
+    seen = []
+    after = None
+    while True:
+        page = player.get('/api/v1/leaderboard', query_string={'limit': 10, 'after': after}).get_json()
+        seen.extend(page['players'])
+        after = page['next_cursor']
+        if after is None:
+            break
+
+    # the 25 players and the one logged in
+    assert len({p['username'] for p in seen}) == 26
+    money = [p['money'] for p in seen]
+    assert money == sorted(money, reverse=True)
+
+
+def test_win_rate_ranking(players, player):
+    page = player.get('/api/v1/leaderboard?by=win_rate&limit=3').get_json()
+
+    assert [p['username'] for p in page['players']] == ['p24', 'p23', 'p22']
+    assert page['players'][0]['win_rate'] == 1.0
+
+
+def test_cache_is_dropped_when_a_round_settles(players, player):
+    assert leaderboard.top_players('money', 1)['players'][0]['money'] == 1400
+    User.query.filter_by(username='player').one().money = 5000
+    db.session.commit()
+    assert leaderboard.top_players('money', 1)['players'][0]['money'] == 1400
+
+    state = player.post('/api/v1/deal', json={'bet_amount': 10}).get_json()
+    while not state['game_over']:
+        action = 'no_insurance' if 'no_insurance' in state['actions'] else 'stand'
+        state = player.post(f'/api/v1/{action}').get_json()
+    assert leaderboard.top_players('money', 1)['players'][0]['username'] == 'player'
+
+
+def test_player_stats(players, player):
+    stats = player.get('/api/v1/users/p20/stats').get_json()
+
+    assert stats['wins'] == 20
+    assert stats['rounds'] == 0
+    assert player.get('/api/v1/users/nobody/stats').status_code == 404
+
+
+def test_leaderboard_api_needs_a_login(players, client):
+    assert client.get('/api/v1/leaderboard').status_code == 401
+    assert client.get('/api/v1/users/p20/stats').status_code == 401
+
+
+@pytest.mark.parametrize('by', ['money', 'win_rate'])
+def test_pages_are_read_from_the_index(players, player, by):
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().startswith('SELECT users.id'):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        page = player.get(f'/api/v1/leaderboard?by={by}&limit=5').get_json()
+        player.get(f'/api/v1/leaderboard?by={by}&limit=5&after={page["next_cursor"]}')
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+
+    connection = db.session.connection().connection.driver_connection
+    plans = [' '.join(row[-1] for row in connection.execute('EXPLAIN QUERY PLAN ' + statement,
+                                                            parameters))
+             for statement, parameters in statements]
+    assert len(plans) == 2
+    assert all(f'ix_users_{by}_id' in plan and 'TEMP B-TREE' not in plan for plan in plans)
+    assert plans[1].startswith('SEARCH')
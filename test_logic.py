@@ -1,5 +1,5 @@
 import pytest
-from BJ_classes import Card, Hand
+from BJ_classes import Card, Hand, Deck, CompactDeck, Shoe, RANKS, encode_card
 
 def test_basic_hand_value():
     hand = Hand()
@@ -15,3 +15,123 @@ def test_ace_as_eleven():
     hand.add_card(Card('5', 'Spades'))
 
     assert hand.get_value() == 15
+
+def test_card_codes_round_trip():
+    for code in range(52):
+        card = Card.from_code(code)
+        assert card.code == code
+        assert encode_card(card.rank, card.suit) == code
+
+def test_compact_deck_draws_every_card_once():
+    deck = CompactDeck()
+    drawn = {deck.draw().show() for _ in range(52)}
+
+    assert len(drawn) == 52
+    assert deck.look_deck() == 0
+
+def test_deck_draw_is_shuffled_pop():
+    deck = Deck()
+    last = deck.cards[-1]
+
+    assert deck.draw() is last
+    assert deck.look_deck() == 51
+
+def test_shoe_holds_every_deck():
+    shoe = Shoe(num_decks=2, penetration=0.5)
+    codes = sorted(shoe.cards)
+
+    assert codes == sorted(list(range(52)) * 2)
+    assert shoe.cut_card == 52
+
+def test_shoe_cut_card_triggers_shuffle():
+    shoe = Shoe(num_decks=1, penetration=0.5)
+    for _ in range(25):
+        shoe.draw()
+    assert not shoe.needs_shuffle()
+
+    shoe.draw()
+    assert shoe.needs_shuffle()
+
+    shoe.shuffle()
+    assert shoe.position == 0
+    assert shoe.look_deck() == 52
+
+def test_shoe_restored_from_position():
+    shoe = Shoe(num_decks=1)
+    first, second = shoe.draw(), shoe.draw()
+    restored = Shoe(num_decks=1, cards=shoe.cards, position=1)
+
+    assert restored.draw().show() == second.show()
+    assert first.show() != "Hidden Card"
+
+# The full rescan get_value() used before the running totals
+def rescan_value(cards):
+    value = 0
+    aces = 0
+    for card in cards:
+        if card.rank in ['Jack', 'Queen', 'King']:
+            value += 10
+        elif card.rank == 'Ace':
+            aces += 1
+            value += 11
+        else:
+            value += int(card.rank)
+    while value > 21 and aces:
+        value -= 10
+        aces -= 1
+    return value
+
+def check_hand(hand):
+    value = rescan_value(hand.hand)
+    assert hand.get_value() == value
+    assert hand.is_bust() == (value > 21)
+    assert hand.is_blackjack() == (len(hand) == 2 and value == 21)
+    # soft means one ace is still counted as 11
+    hard = sum(1 if c.rank == 'Ace' else 10 if c.rank in ['Jack', 'Queen', 'King']
+               else int(c.rank) for c in hand.hand)
+    assert hand.is_soft() == (value != hard)
+
+def test_value_matches_rescan_for_every_hand_up_to_bust():
+    # Every combination of ranks, each ending with the card that busts it.
+    # The running totals do not depend on order, the next test covers that.
+    checked = 0
+
+    def extend(ranks, start):
+        nonlocal checked
+        hand = Hand()
+        for rank in ranks:
+            hand.add_card(Card(rank, 'Spades'))
+        check_hand(hand)
+        checked += 1
+        if hand.is_bust():
+            return
+        for i in range(start, len(RANKS)):
+            extend(ranks + [RANKS[i]], i)
+
+    extend([], 0)
+    assert checked == 19596
+
+def test_value_matches_rescan_in_any_order():
+    for first in RANKS:
+        for second in RANKS:
+            for third in RANKS:
+                hand = Hand()
+                for rank in (first, second, third):
+                    hand.add_card(Card(rank, 'Hearts'))
+                    check_hand(hand)
+
+def test_remove_and_restart_keep_totals(capsys):
+    hand = Hand()
+    for rank in ('Ace', 'Ace', '9', 'King'):
+        hand.add_card(Card(rank, 'Clubs'))
+    while len(hand):
+        check_hand(hand)
+        hand.remove_card()
+    check_hand(hand)
+
+    hand.add_card(Card('Ace', 'Clubs'))
+    hand.add_card(Card('King', 'Clubs'))
+    assert hand.is_blackjack() and hand.is_soft()
+
+    hand.restart_hand()
+    assert hand.get_value() == 0 and not hand.is_soft()
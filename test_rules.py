@@ -0,0 +1,272 @@
+import random
+import pytest
+from BJ_classes import Player, Card, encode_card
+from database import GameRound
+import rules
+from rules import Rules, deal, apply, legal_actions, payout, wagered, pack, unpack
+
+
+def shoe(*ranks):
+    # Dealt in order: player, player, dealer hole, dealer up, then every draw
+    codes = [encode_card(rank, 'Clubs') for rank in ranks]
+    return bytes(codes + [encode_card('2', 'Hearts')] * 20)
+
+
+def play(table_rules, cards, *actions, bet=10):
+    state = deal(table_rules, cards, 0, bet)
+    for action in actions:
+        state = apply(table_rules, state, action)
+    return state
+
+
+def test_blackjack_pays_3_to_2():
+    state = deal(Rules(), shoe('Ace', 'King', '9', '7'), 0, 10)
+
+    assert state.phase == rules.DONE
+    assert state.results == (('blackjack', 25),)
+    assert deal(Rules(blackjack_pays=1.2), shoe('Ace', 'King', '9', '7'), 0, 10).results == (('blackjack', 22),)
+
+
+def test_dealer_natural_is_checked_first():
+    state = deal(Rules(), shoe('9', '8', 'Ace', 'King'), 0, 10)
+
+    assert state.phase == rules.DONE
+    assert state.results == (('loss', 0),)
+    assert deal(Rules(), shoe('Ace', 'King', 'Ace', 'King'), 0, 10).results == (('push', 10),)
+
+
+def test_insurance_pays_against_a_natural():
+    state = deal(Rules(), shoe('9', '8', 'King', 'Ace'), 0, 10)
+    assert legal_actions(Rules(), state) == ('insurance', 'no_insurance')
+    assert rules.cost(state, 'insurance') == 5
+
+    state = apply(Rules(), state, 'insurance')
+    assert state.phase == rules.DONE
+    assert wagered(state) == 15
+    assert payout(state) == 15
+
+    lost = play(Rules(), shoe('9', '8', '7', 'Ace'), 'insurance', 'stand')
+    assert lost.phase == rules.DONE
+    assert payout(lost) == 0
+    assert wagered(lost) == 15
+
+
+def test_no_insurance_without_the_rule():
+    state = deal(Rules(insurance=False), shoe('9', '8', '7', 'Ace'), 0, 10)
+    assert 'insurance' not in legal_actions(Rules(insurance=False), state)
+
+
+def test_surrender_returns_half():
+    state = play(Rules(), shoe('10', '6', '8', '10'), 'surrender')
+
+    assert state.results == (('surrender', 5),)
+    assert 'surrender' not in legal_actions(Rules(surrender=False), deal(Rules(surrender=False), shoe('10', '6', '8', '10'), 0, 10))
+
+
+def test_double_takes_one_card():
+    state = play(Rules(), shoe('6', '5', '10', '7', '10'), 'double')
+
+    assert state.hands[0].bet == 20
+    assert state.hands[0].cards[-1] == encode_card('10', 'Clubs')
+    assert state.results == (('win', 40),)
+
+
+def test_split_plays_both_hands():
+    table_rules = Rules()
+    state = play(table_rules, shoe('8', '8', '10', '7', '3', '10'), 'split')
+    assert len(state.hands) == 2
+    assert state.active == 0
+    # 8 + 3, doubling after the split is allowed
+    assert 'double' in legal_actions(table_rules, state)
+    assert 'surrender' not in legal_actions(table_rules, state)
+
+    state = apply(table_rules, state, 'double')
+    assert state.active == 1
+    state = apply(table_rules, state, 'stand')
+    assert state.phase == rules.DONE
+    assert wagered(state) == 30
+    assert [label for label, _ in state.results] == ['win', 'loss']
+
+    no_das = Rules(double_after_split=False)
+    assert 'double' not in legal_actions(no_das, play(no_das, shoe('8', '8', '10', '7', '3'), 'split'))
+
+
+def test_split_aces_take_one_card():
+    state = play(Rules(), shoe('Ace', 'Ace', '10', '7', 'King', '9'), 'split')
+
+    assert state.phase == rules.DONE
+    # 21 after a split is not a natural
+    assert state.results == (('win', 20), ('win', 20))
+
+
+def test_resplit_aces():
+    cards = shoe('Ace', 'Ace', '10', '7', 'Ace', '9', '8')
+    assert play(Rules(), cards, 'split').phase == rules.DONE
+
+    state = play(Rules(resplit_aces=True), cards, 'split')
+    assert legal_actions(Rules(resplit_aces=True), state) == ('stand', 'split')
+    state = apply(Rules(resplit_aces=True), state, 'split')
+    assert state.phase == rules.DONE
+    assert len(state.hands) == 3
+
+
+def test_dealer_soft_17():
+    cards = shoe('10', '8', 'Ace', '6', '3')
+
+    assert play(Rules(), cards, 'stand').dealer == tuple(cards[2:4])
+    assert play(Rules(dealer_hits_soft_17=True), cards, 'stand').dealer == tuple(cards[2:5])
+
+
+def test_illegal_actions_are_refused():
+    state = play(Rules(), shoe('10', '6', '8', '10', '5'), 'hit')
+
+    with pytest.raises(rules.IllegalAction):
+        apply(Rules(), state, 'double')
+    with pytest.raises(rules.IllegalAction):
+        apply(Rules(), deal(Rules(), shoe('9', '8', '7', '6'), 0, 10), 'split')
+
+
+def test_double_bet_takes_the_second_bet():
+    player = Player(balance=100)
+    player.place_bet(60)
+
+    assert not player.double_bet(Card('5', 'Clubs'))
+    player.balance = 100
+    assert player.double_bet(Card('5', 'Clubs'))
+    assert (player.balance, player.current_bet, len(player.hand)) == (40, 120, 1)
+
+
+def test_short_shoe_is_not_dealt_around():
+    with pytest.raises(rules.ShoeExhausted):
+        deal(Rules(), shoe('10', '9')[:3], 0, 10)
+    state = deal(Rules(), shoe('10', '6', '10', '7')[:4], 0, 10)
+    with pytest.raises(rules.ShoeExhausted):
+        apply(Rules(), state, 'hit')
+
+
+def test_fuzz_random_play():
+    # Random legal moves under random rules: every round ends, transitions are
+    # pure, the packed state round trips and the money adds up
+    rng = random.Random(7)
+    codes = list(range(52)) * 2
+    for _ in range(3000):
+        table_rules = Rules(rng.random() < 0.5, rng.random() < 0.5, rng.random() < 0.5,
+                            rng.random() < 0.5, rng.randint(2, 4), rng.random() < 0.5,
+                            rng.random() < 0.5, rng.choice((1.5, 1.2, 1.0)))
+        rng.shuffle(codes)
+        cards = bytes(codes)
+        bet = rng.randint(1, 100)
+        state = deal(table_rules, cards, 0, bet)
+        while state.phase != rules.DONE:
+            assert unpack(pack(state), cards, state.pos) == state
+            action = rng.choice(legal_actions(table_rules, state))
+            after = apply(table_rules, state, action)
+            assert apply(table_rules, state, action) == after
+            assert after.pos >= state.pos
+            state = after
+        assert unpack(pack(state), cards, state.pos) == state
+        assert len(state.results) == len(state.hands) <= table_rules.max_hands
+        assert 0 <= payout(state) <= wagered(state) * 3
+        # every card on the table came from the shoe once
+        assert state.pos == sum(len(h.cards) for h in state.hands) + len(state.dealer)
+
+
+def test_simulation_needs_a_hand():
+    with pytest.raises(ValueError):
+        rules.simulate(Rules(), 0)
+    with pytest.raises(SystemExit):
+        rules.main(['--hands', '0'])
+
+
+def test_basic_strategy_edge():
+    stats = rules.simulate(Rules(), 20000, seed=1)
+
+    assert stats['hands'] == 20000
+    assert -0.05 < stats['ev'] < 0.03
+
+
+def test_web_split_and_double(player):
+    state = player.post('/api/v1/deal', json={'bet_amount': 10}).get_json()
+    while state['game_over'] or not {'double', 'split'} & set(state['actions']):
+        state = player.post('/api/v1/deal', json={'bet_amount': 10}).get_json()
+    money = state['money']
+    action = 'split' if 'split' in state['actions'] else 'double'
+
+    state = player.post(f'/api/v1/{action}').get_json()
+    assert state['bet'] == 20
+    if not state['game_over']:
+        assert state['money'] == money - 10
+    while not state['game_over']:
+        assert player.post('/stand').status_code == 302
+        state = player.get('/api/v1/state').get_json()
+    assert state['result']
+    assert all(hand['result'] for hand in state['hands'])
+    assert player.post('/api/v1/double').status_code == 409
+    assert player.get('/game').status_code == 200
+
+
+def test_replayed_session_cannot_pay_twice(player):
+    state = player.post('/api/v1/deal', json={'bet_amount': 10}).get_json()
+    while state['game_over'] or 'double' not in state['actions']:
+        state = player.post('/api/v1/deal', json={'bet_amount': 10}).get_json()
+    cookie = player.get_cookie('session').value
+
+    money = player.post('/api/v1/double').get_json()['money']
+    # the cookie from before the double comes back
+    player.set_cookie('session', cookie)
+    assert player.post('/api/v1/double').status_code == 409
+    player.set_cookie('session', cookie)
+    assert player.post('/api/v1/stand').status_code == 409
+
+    player.set_cookie('session', cookie)
+    state = player.post('/api/v1/deal', json={'bet_amount': 10}).get_json()
+    if not state['game_over']:
+        assert state['money'] == money - 10
+
+
+def test_web_shoe_shuffles_when_it_runs_out(player, app):
+    app.config['SHOE_PENETRATION'] = 1.0
+    try:
+        player.post('/deal', data={'bet_amount': '10'})
+    finally:
+        app.config['SHOE_PENETRATION'] = 0.75
+    with player.session_transaction() as sess:
+        sess.pop('round_key', None)
+        sess['shoe_pos'] = 6 * 52 - 2
+        shoe_id = sess['shoe_id']
+
+    assert player.post('/deal', data={'bet_amount': '10'}).status_code == 302
+    with player.session_transaction() as sess:
+        assert sess['shoe_id'] == shoe_id
+        assert 4 <= sess['shoe_pos'] < 20
+
+
+def test_refused_deal_keeps_the_round_it_cannot_replace(player):
+    state = player.post('/api/v1/deal', json={'bet_amount': 100}).get_json()
+    while state['game_over'] or 'stand' not in state['actions']:
+        state = player.post('/api/v1/deal', json={'bet_amount': 100}).get_json()
+    assert player.post('/api/v1/deal', json={'bet_amount': 10**9}).status_code == 400
+    cookie = player.get_cookie('session').value
+    with player.application.app_context():
+        rounds = GameRound.query.count()
+
+    money = player.post('/api/v1/stand').get_json()['money']
+    for _ in range(5):
+        player.set_cookie('session', cookie)
+        player.post('/api/v1/stand')
+    state = player.get('/api/v1/state').get_json()
+
+    assert state['money'] == money
+    with player.application.app_context():
+        assert GameRound.query.count() == rounds + 1
+
+
+def test_round_without_a_key_is_not_played(player):
+    with player.session_transaction() as sess:
+        sess['player_hand'] = [{'rank': '10', 'suit': 'Clubs'}, {'rank': '6', 'suit': 'Clubs'}]
+        sess['dealer_hand'] = [{'rank': '9', 'suit': 'Clubs'}, {'rank': '7', 'suit': 'Clubs'}]
+        sess['bet'] = 10
+
+    assert player.post('/api/v1/stand').status_code == 409
+    with player.application.app_context():
+        assert GameRound.query.count() == 0
@@ -0,0 +1,89 @@
+import threading
+import pytest
+from security import PasswordHasher, HasherBusy, TokenBucket
+from database import db, User
+
+
+def test_token_bucket():
+    bucket = TokenBucket(capacity=3, rate=0)
+
+    assert [bucket.allow('a') for _ in range(4)] == [True, True, True, False]
+    assert bucket.allow('b')
+
+
+def test_token_bucket_refills():
+    bucket = TokenBucket(capacity=1, rate=1000)
+
+    assert bucket.allow('a')
+    threading.Event().wait(0.01)
+    assert bucket.allow('a')
+
+
+def test_hasher_round_trip():
+    hasher = PasswordHasher('pbkdf2:sha256:1000', workers=1)
+    pwhash = hasher.hash('secret')
+
+    assert hasher.verify(pwhash, 'secret')
+    assert not hasher.verify(pwhash, 'wrong')
+    assert not hasher.needs_rehash(pwhash)
+    assert PasswordHasher('pbkdf2:sha256:2000').needs_rehash(pwhash)
+    assert PasswordHasher('pbkdf2:sha256:1000', salt_length=8).needs_rehash(pwhash)
+
+
+def test_hasher_busy():
+    hasher = PasswordHasher('pbkdf2:sha256:1000', workers=1, queue_limit=0)
+    release = threading.Event()
+    worker = threading.Thread(target=hasher._run, args=(release.wait,))
+    worker.start()
+    try:
+        with pytest.raises(HasherBusy):
+            threading.Event().wait(0.05)
+            hasher.hash('secret')
+    finally:
+        release.set()
+        worker.join()
+
+
+def test_hasher_timeout_keeps_the_slot():
+    hasher = PasswordHasher('pbkdf2:sha256:1000', workers=1, queue_limit=0, timeout=0.01)
+    release = threading.Event()
+    try:
+        with pytest.raises(HasherBusy):
+            hasher._run(release.wait)
+        # the timed out hash still runs, nothing else may start
+        with pytest.raises(HasherBusy):
+            hasher.hash('secret')
+    finally:
+        release.set()
+    threading.Event().wait(0.05)
+    assert hasher.hash('secret')
+
+
+def test_login_rehashes_old_hashes(client, app):
+    client.post('/register', data={'username': 'old', 'password': 'secret'})
+    user = User.query.filter_by(username='old').first()
+    user.password_hash = PasswordHasher('pbkdf2:sha256:500').hash('secret')
+    db.session.commit()
+
+    client.post('/login', data={'username': 'old', 'password': 'secret'})
+
+    assert User.query.filter_by(username='old').first().password_hash.startswith('pbkdf2:sha256:1000$')
+
+
+def test_login_throttled(client):
+    for _ in range(5):
+        assert client.post('/login', data={'username': 'nobody', 'password': 'x'}).status_code == 200
+    assert client.post('/login', data={'username': 'nobody', 'password': 'x'}).status_code == 429
+
+
+def test_login_ip_limit_uses_the_forwarded_client(client, app, monkeypatch):
+    # as with PROXY_FIX_HOPS=1, every request comes from the same proxy
+    from werkzeug.middleware.proxy_fix import ProxyFix
+    monkeypatch.setattr(app, 'wsgi_app', ProxyFix(app.wsgi_app, x_for=1))
+
+    def login(n, ip):
+        return client.post('/login', data={'username': f'user{n}', 'password': 'x'},
+                           headers={'X-Forwarded-For': ip}).status_code
+
+    assert [login(n, '203.0.113.1') for n in range(21)][-2:] == [200, 429]
+    assert login(21, '203.0.113.2') == 200
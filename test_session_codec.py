@@ -0,0 +1,47 @@
+from flask.sessions import SecureCookieSessionInterface
+from session_codec import CompactSessionSerializer, CompactSessionInterface, MAGIC
+
+SESSION = {
+    'user_id': 1, 'username': 'player', 'bet': 50,
+    'shoe_id': '0123456789abcdef0123456789abcdef', 'round_key': 'ABC',
+    'player_hand': [{'rank': 'Ace', 'suit': 'Spades'}, {'rank': '10', 'suit': 'Hearts'}],
+    'dealer_hand': [{'rank': 'King', 'suit': 'Clubs'}],
+    'deck': [{'rank': 'Joker', 'suit': 'None'}],
+    'result': None, 'game_over': False, 'play': b'\x00\xff\x01',
+}
+
+
+def test_round_trip():
+    serializer = CompactSessionSerializer()
+    payload = serializer.dumps(SESSION)
+
+    assert payload.startswith(MAGIC)
+    assert serializer.loads(payload) == SESSION
+    assert serializer.loads(serializer.dumps({})) == {}
+
+
+def test_cards_take_one_byte():
+    serializer = CompactSessionSerializer()
+    cards = [{'rank': 'Ace', 'suit': 'Spades'}] * 20
+    short = serializer.dumps({'player_hand': cards[:1]})
+
+    assert len(serializer.dumps({'player_hand': cards})) - len(short) == 19
+
+
+def test_reads_legacy_cookies(app):
+    legacy = SecureCookieSessionInterface().get_signing_serializer(app).dumps(SESSION)
+
+    for compress in (True, False):
+        signer = CompactSessionInterface(compress).get_signing_serializer(app)
+        assert signer.loads(legacy) == SESSION
+        cookie = signer.dumps(SESSION)
+        assert signer.loads(cookie) == SESSION
+        assert len(cookie) < len(legacy)
+
+
+def test_game_with_compact_cookie(player):
+    state = player.post('/api/v1/deal', json={'bet_amount': 10}).get_json()
+
+    assert player.get('/api/v1/state').get_json() == state
+    cookie = player.get_cookie('session').value
+    assert len(cookie) < 400
@@ -0,0 +1,82 @@
+import pytest
+from BJ_classes import Shoe
+import rules
+from shoe_store import MemoryShoeStore, SQLShoeStore, RedisShoeStore
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = bytes(value)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+@pytest.fixture(params=['memory', 'sql', 'redis'])
+def store(request, app):
+    if request.param == 'memory':
+        return MemoryShoeStore()
+    if request.param == 'sql':
+        return SQLShoeStore()
+    return RedisShoeStore(FakeRedis())
+
+
+def test_store_round_trip(store):
+    shoe = Shoe(num_decks=2, penetration=0.6)
+    store.save('abc', shoe)
+    loaded = store.load('abc')
+
+    assert loaded.cards == shoe.cards
+    assert loaded.num_decks == 2
+    assert loaded.cut_card == shoe.cut_card
+
+    store.delete('abc')
+    assert store.load('abc') is None
+
+
+def test_memory_store_drops_oldest_shoe():
+    store = MemoryShoeStore(max_shoes=2)
+    for shoe_id in ('a', 'b', 'c'):
+        store.save(shoe_id, Shoe(num_decks=1))
+
+    assert store.load('a') is None
+    assert store.load('c') is not None
+
+
+def test_session_keeps_only_shoe_position(player):
+    player.post('/deal', data={'bet_amount': '10'})
+    with player.session_transaction() as sess:
+        assert 'deck' not in sess
+        assert sess['shoe_pos'] == 4
+        shoe_id = sess['shoe_id']
+
+    player.post('/stand')
+    player.post('/deal', data={'bet_amount': '10'})
+    with player.session_transaction() as sess:
+        assert sess['shoe_id'] == shoe_id
+        assert sess['shoe_pos'] > 4
+
+
+def test_shuffle_is_stored_even_when_the_position_moves_on(player, app):
+    # the cut card comes out after 2 cards, the next deal shuffles first
+    decks, penetration = app.config['SHOE_DECKS'], app.config['SHOE_PENETRATION']
+    app.config.update(SHOE_DECKS=1, SHOE_PENETRATION=0.05)
+    try:
+        player.post('/deal', data={'bet_amount': '10'})
+    finally:
+        app.config.update(SHOE_DECKS=decks, SHOE_PENETRATION=penetration)
+    with player.session_transaction() as sess:
+        sess['shoe_pos'] = 3
+
+    player.post('/deal', data={'bet_amount': '10'})
+    with player.session_transaction() as sess:
+        stored = app.extensions['shoe_store'].load(sess['shoe_id'])
+        state = rules.unpack(sess['play'])
+    assert state.hands[0].cards[:2] == tuple(stored.cards[:2])
+    assert state.dealer == tuple(stored.cards[2:4])
@@ -0,0 +1,35 @@
+import pytest
+from simulator import simulate, main
+
+
+def check_report(report, hands):
+    assert report["hands"] == hands
+    assert report["win_rate"] + report["loss_rate"] + report["push_rate"] == pytest.approx(1)
+    # the table rules give the house a clear edge for a stand-on-17 player
+    assert 0.03 < report["house_edge"] < 0.13
+
+
+def test_python_engine_report():
+    check_report(simulate(20_000, engine="python", seed=3), 20_000)
+
+
+def test_numpy_engine_matches_python_engine():
+    pytest.importorskip("numpy")
+    fast = simulate(200_000, engine="numpy", seed=3)
+    slow = simulate(20_000, engine="python", seed=3)
+
+    check_report(fast, 200_000)
+    assert fast["player_bust_rate"] == pytest.approx(slow["player_bust_rate"], abs=0.02)
+    assert fast["dealer_bust_rate"] == pytest.approx(slow["dealer_bust_rate"], abs=0.02)
+
+
+def test_simulation_is_reproducible_with_seed():
+    pytest.importorskip("numpy")
+    assert simulate(10_000, seed=7)["ev"] == simulate(10_000, seed=7)["ev"]
+
+
+def test_simulation_needs_a_hand():
+    with pytest.raises(ValueError):
+        simulate(0, engine="python")
+    with pytest.raises(SystemExit):
+        main(["--hands", "0", "--engine", "python"])
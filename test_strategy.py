@@ -0,0 +1,75 @@
+import pytest
+import strategy
+import rules
+from BJ_classes import encode_card
+
+
+@pytest.fixture(scope="module")
+def table():
+    return strategy.build_table(strategy.full_composition(6))
+
+
+def test_dealer_distribution_sums_to_one():
+    for upcard in range(1, 11):
+        dist = strategy.dealer_distribution(upcard, strategy.full_composition(6))
+        assert sum(dist.values()) == pytest.approx(1)
+    # a dealer showing 6 busts far more often than one showing 10
+    full = strategy.full_composition(6)
+    assert strategy.dealer_distribution(6, full)["bust"] > strategy.dealer_distribution(10, full)["bust"]
+
+
+def test_basic_strategy_decisions(table):
+    assert strategy.advise(table, 16, False, 10)["action"] == "hit"
+    assert strategy.advise(table, 13, False, 4)["action"] == "stand"
+    assert strategy.advise(table, 12, False, 2)["action"] == "hit"
+    assert strategy.advise(table, 18, True, 9)["action"] == "hit"
+    assert strategy.advise(table, 20, False, 10)["action"] == "stand"
+
+
+def test_upcard_missing_from_the_composition():
+    # the upcard was the last ace of a single deck
+    table = strategy.build_table((0,) + strategy.full_composition(1)[1:])
+
+    assert strategy.advise(table, 16, False, 1)['action'] in ('hit', 'stand')
+
+
+def test_table_save_and_load(table, tmp_path):
+    path = tmp_path / "table.json"
+    strategy.save_table(table, path)
+
+    assert strategy.load_table(path) == table
+
+
+def test_hint_route(player, app):
+    assert player.get('/hint').status_code == 400
+
+    # naturals and the insurance question have no hint, deal until there is a hand to play
+    while 'hit' not in player.post('/api/v1/deal', json={'bet_amount': 10}).get_json()['actions']:
+        pass
+    moves = ('hit', 'stand', 'double', 'split', 'surrender')
+    advice = player.get('/hint').get_json()
+    assert advice['action'] in moves
+
+    app.config['HINT_MODE'] = 'shoe'
+    try:
+        assert player.get('/hint').get_json()['action'] in moves
+    finally:
+        app.config['HINT_MODE'] = 'basic'
+
+
+def test_hint_follows_the_table_rules(player, app):
+    player.post('/deal', data={'bet_amount': '10'})
+    # 11 against an ace is doubled only when the dealer hits soft 17
+    hand = rules.PlayerHand((encode_card('6', 'Clubs'), encode_card('5', 'Clubs')), 10)
+    dealer = (encode_card('9', 'Clubs'), encode_card('Ace', 'Clubs'))
+    state = rules.State(None, 0, rules.PLAYER, (hand,), 0, dealer, 0, ())
+    with player.session_transaction() as sess:
+        sess['play'] = rules.pack(state)
+
+    assert player.get('/hint').get_json()['action'] == 'hit'
+    table_rules = app.config['RULES']
+    app.config['RULES'] = table_rules._replace(dealer_hits_soft_17=True)
+    try:
+        assert player.get('/hint').get_json()['action'] == 'double'
+    finally:
+        app.config['RULES'] = table_rules
@@ -0,0 +1,151 @@
+import json
+from database import User, GameRound
+from tables import Table, TableManager, MAX_SEATS, EMPTY_SECONDS
+
+
+def play_out(table):
+    settlements = []
+    while table.phase == 'playing':
+        current = table.seats[table.turn].user_id
+        error, settled = table.stand(current)
+        assert error is None
+        settlements += settled
+    return settlements
+
+
+def test_round_with_two_seats():
+    table = Table(num_decks=1)
+    assert table.join(1, 'ann') == 0
+    assert table.join(2, 'bob') == 1
+
+    assert table.place_bet(1, 10, 'r1') == (None, [])
+    assert table.phase == 'betting'
+    error, settlements = table.place_bet(2, 20, 'r2')
+    assert error is None
+    assert table.phase in ('playing', 'finished')
+
+    settlements += play_out(table)
+    assert table.phase == 'finished'
+    assert sorted(s[1] for s in settlements) == ['r1', 'r2']
+    assert all(len(seat['hand']) >= 2 for seat in table.state()['seats'] if seat)
+
+
+def test_only_the_seat_in_turn_can_act():
+    table = Table(num_decks=1)
+    table.join(1, 'ann')
+    table.join(2, 'bob')
+    table.place_bet(1, 10, 'r1')
+    table.place_bet(2, 10, 'r2')
+    if table.phase == 'playing':
+        waiting = 2 if table.turn == 0 else 1
+        assert table.hit(waiting)[0] == "Not your turn"
+
+
+def test_leaving_before_the_deal_returns_the_bet():
+    table = Table(num_decks=1)
+    table.join(1, 'ann')
+    table.join(2, 'bob')
+    table.place_bet(1, 10, 'r1')
+
+    assert table.leave(1) == (None, [(1, 'r1', 10, 'push', 10)])
+    assert table.seats[0] is None
+    assert table.phase == 'betting'
+
+
+def test_seat_stands_when_its_turn_runs_out():
+    table = Table(num_decks=1, turn_seconds=0)
+    table.join(1, 'ann')
+    table.place_bet(1, 10, 'r1')
+    if table.phase == 'playing':
+        settlements = table.expire_turn()
+        assert [s[1] for s in settlements] == ['r1']
+    assert table.phase == 'finished'
+    assert table.expire_turn() == []
+
+
+def test_tables_per_user_are_capped():
+    tables = TableManager(num_decks=1, tables_per_user=1)
+
+    assert tables.create(1) is not None
+    assert tables.create(1) is None
+    assert tables.create(2) is not None
+
+
+def test_empty_and_idle_tables_are_dropped():
+    tables = TableManager(num_decks=1, idle_seconds=600)
+    empty = tables.create(1)
+    idle = tables.create(2)
+    busy = tables.create(3)
+    idle.join(2, 'bob')
+    idle.join(4, 'eve')
+    idle.place_bet(2, 10, 'r2')
+    busy.join(3, 'ann')
+    empty.last_change -= EMPTY_SECONDS + 1
+    idle.last_change -= 601
+
+    assert tables.prune() == [(2, 'r2', 10, 'push', 10)]
+    assert [t['id'] for t in tables.list()] == [busy.id]
+    assert idle.closed
+
+
+def test_table_is_full_after_seven_players():
+    table = Table(num_decks=1)
+    for user_id in range(MAX_SEATS):
+        assert table.join(user_id, f"p{user_id}") == user_id
+    assert table.join(99, 'late') is None
+
+
+def test_hole_card_hidden_until_the_end():
+    table = Table(num_decks=1)
+    table.join(1, 'ann')
+    table.place_bet(1, 10, 'r1')
+    state = table.state(1)
+    if state['phase'] == 'playing':
+        assert state['dealer_hand'][0] is None
+        assert state['dealer_score'] is None
+        table.stand(1)
+    assert None not in table.state(1)['dealer_hand']
+
+
+def test_table_routes_settle_bets(app, client):
+    other = app.test_client()
+    for c, name in ((client, 'ann'), (other, 'bob')):
+        c.post('/register', data={'username': name, 'password': 'pw'})
+        c.post('/login', data={'username': name, 'password': 'pw'})
+
+    client.post('/tables')
+    table_id = app.extensions['tables'].list()[-1]['id']
+    for c in (client, other):
+        assert c.post(f'/tables/{table_id}/join').status_code == 200
+    client.post(f'/tables/{table_id}/bet', json={'bet_amount': 100})
+    state = other.post(f'/tables/{table_id}/bet', json={'bet_amount': 50}).get_json()
+
+    clients = {'ann': client, 'bob': other}
+    while state['phase'] == 'playing':
+        player = state['seats'][state['turn']]['username']
+        state = clients[player].post(f'/tables/{table_id}/stand').get_json()
+
+    rounds = {r.bet: r for r in GameRound.query.all()}
+    assert set(rounds) == {100, 50}
+    ann = User.query.filter_by(username='ann').one()
+    assert ann.money == 900 + rounds[100].payout
+
+    response = client.get(f'/tables/{table_id}/events', buffered=False)
+    first = next(response.response)
+    response.close()
+    assert json.loads(first.decode()[len('data: '):])['phase'] == 'finished'
+
+
+def test_lobby_caps_new_tables(app, player):
+    for _ in range(2):
+        assert player.post('/tables').status_code == 302
+    assert player.post('/tables').status_code == 429
+
+
+def test_refused_table_bet_is_paid_back(app, player):
+    player.post('/tables')
+    table_id = app.extensions['tables'].list()[-1]['id']
+
+    # not seated yet
+    assert player.post(f'/tables/{table_id}/bet', json={'bet_amount': 100}).status_code == 409
+    assert User.query.filter_by(username='player').one().money == 1000